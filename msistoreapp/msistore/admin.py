@@ -1,9 +1,16 @@
 from django.contrib import admin
-from .models import User, Product, Image, Category
+from .models import User, Product, Image, Category, OrderSummary
 
 admin.site.register(User)
 admin.site.register(Product)
 admin.site.register(Image)
 admin.site.register(Category)
 
+
+@admin.register(OrderSummary)
+class OrderSummaryAdmin(admin.ModelAdmin):
+    list_display = ['order', 'item_count', 'total_quantity', 'total_price', 'delivery_stage', 'is_paid', 'updated_at']
+    list_filter = ['delivery_stage', 'is_paid']
+    list_select_related = ['order']
+
 # Register your models here.
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import async_views
+
+urlpatterns = [
+    path('products/', async_views.product_list),
+    path('products/<int:pk>/', async_views.product_detail),
+    path('order/get-receipt/', async_views.get_receipt),
+    path('order/create/', async_views.create_order),
+]
@@ -0,0 +1,199 @@
+"""
+Async (ASGI) versions of the hot catalogue and order endpoints, mounted under
+``/async/``:
+
+    GET  /async/products/             product list (same params/output as /products/, no cursor/facets/grid)
+    GET  /async/products/<id>/        product detail
+    GET  /async/order/get-receipt/    receipts of the current user (?page / ?page_size)
+    POST /async/order/get-receipt/    receipt of one order (uuid)
+    POST /async/order/create/         create an order
+
+Other HTTP methods get a 405, like the sync endpoints. Queries use the async
+ORM; authentication and the order transaction (which the async ORM cannot
+span) run through sync_to_async. Run under an ASGI
+server, e.g. ``uvicorn msistoreapp.asgi:application``; under WSGI Django runs
+them in a thread like any other view.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import Product
+from .pagination import CachedCountPaginator, CustomPagination, ReceiptPagination, acached_count
+from .renderers import FastJSONRenderer
+from .serializers import ProductSerializer, ReceiptSerializer
+from .views import OrderViewSet, ProductViewSet
+from . import fastpath
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def error_response(exc, request=None):
+    response = json_response({'detail': exc.detail}, status=exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)) and request is not None:
+        # as APIView.handle_exception: 401 with the authenticator's challenge, 403 when there is none
+        header = request.authenticators[0].authenticate_header(request) if request.authenticators else None
+        if header:
+            response['WWW-Authenticate'] = header
+        else:
+            response.status_code = status.HTTP_403_FORBIDDEN
+    return response
+
+
+def drf_request(request):
+    # DRF Request for the serializers/pagination (query_params, build_absolute_uri) and body parsing
+    return Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+                   authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+
+
+async def authenticate(request):
+    # OAuth2Authentication reads the token from the DB (sync)
+    user = await sync_to_async(lambda: request.user)()
+    if user.is_anonymous:
+        raise exceptions.NotAuthenticated()
+    return user
+
+
+def async_view(*methods):
+    """
+    Allow only ``methods`` (plus OPTIONS), answering others with 405 like the
+    sync router, and exempt the view from CSRF like DRF views. Django 4.2's
+    require_http_methods and csrf_exempt would turn the async view into a sync one.
+    """
+    allow = ', '.join([*methods, 'OPTIONS'])
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method == 'OPTIONS':
+                response = HttpResponse()
+            elif request.method not in methods:
+                response = error_response(exceptions.MethodNotAllowed(request.method))
+            else:
+                return await view(request, *args, **kwargs)
+            response['Allow'] = allow
+            return response
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+async def paginate(queryset, request, pagination):
+    """
+    Async counterpart of PageNumberPagination.paginate_queryset: COUNT and the
+    page are read with the async ORM. Returns (rows, pagination) with
+    ``pagination.page`` set, ready for get_paginated_response.
+    """
+    page_size = pagination.get_page_size(request)
+    paginator = pagination.django_paginator_class(queryset, page_size)
+    if issubclass(pagination.django_paginator_class, CachedCountPaginator):
+        paginator.count = await acached_count(queryset)
+    else:
+        paginator.count = await queryset.acount()
+    page_number = request.query_params.get(pagination.page_query_param, 1)
+    if page_number in pagination.last_page_strings:
+        page_number = paginator.num_pages
+    try:
+        page = paginator.page(page_number)
+    except InvalidPage as exc:
+        raise exceptions.NotFound(pagination.invalid_page_message.format(page_number=page_number, message=str(exc)))
+    page.object_list = [row async for row in page.object_list]
+    pagination.page = page
+    pagination.request = request
+    return page.object_list, pagination
+
+
+@async_view('GET', 'HEAD')
+async def product_list(request):
+    request = drf_request(request)
+    view = ProductViewSet(request=request, action='list', format_kwarg=None)
+    fields = fastpath.list_fields(view.requested_fields())
+    queryset = view.filter_products(Product.objects.order_by('id'), request.query_params)
+    try:
+        rows, pagination = await paginate(fastpath.product_values(queryset, fields), request, CustomPagination())
+    except exceptions.APIException as exc:
+        return error_response(exc)
+    images = None
+    if 'images' in fields:
+        image_rows = fastpath.image_rows([row['id'] for row in rows], request)
+        images = fastpath.group_images([image async for image in image_rows], request)
+    data = fastpath.serialize_products(rows, request, fields, images)
+    return json_response(pagination.get_paginated_response(data).data)
+
+
+@async_view('GET', 'HEAD')
+async def product_detail(request, pk):
+    request = drf_request(request)
+    view = ProductViewSet(request=request, action='retrieve', format_kwarg=None)
+    try:
+        product = await ProductSerializer.setup_eager_loading(Product.objects.all()).aget(pk=pk)
+    except Product.DoesNotExist:
+        return error_response(exceptions.NotFound())
+    serializer = ProductSerializer(product, fields=view.requested_fields(), context={'request': request})
+    return json_response(serializer.data)
+
+
+@async_view('GET', 'HEAD', 'POST')
+async def get_receipt(request):
+    request = drf_request(request)
+    try:
+        user = await authenticate(request)
+        view = OrderViewSet()
+        orders = view.get_receipt_queryset()
+        context = {'request': request}
+        if request.method == 'POST':
+            uuid = view.parse_receipt_uuid(request.data)
+            if uuid is None:
+                return json_response({"errors": "uuid is missing or invalid"}, status=status.HTTP_400_BAD_REQUEST)
+            order = await orders.filter(uuid=uuid, user_id=user.id).afirst()
+            if order is None:
+                raise exceptions.NotFound()
+            return json_response(ReceiptSerializer(order, context=context).data)
+
+        orders = orders.filter(user_id=user.id)
+        pagination = ReceiptPagination()
+        if any(param in request.query_params for param in ('page', pagination.page_size_query_param)):
+            page, pagination = await paginate(orders, request, pagination)
+            return json_response(pagination.get_paginated_response(
+                ReceiptSerializer(page, many=True, context=context).data).data)
+        # prefetch_related runs in the async iterator's thread
+        orders = [order async for order in orders]
+        return json_response(ReceiptSerializer(orders, many=True, context=context).data)
+    except exceptions.APIException as exc:
+        return error_response(exc, request)
+
+
+@async_view('POST')
+async def create_order(request):
+    request = drf_request(request)
+    view = OrderViewSet()
+    try:
+        user = await authenticate(request)
+        data = request.data
+    except exceptions.APIException as exc:
+        return error_response(exc, request)
+
+    order_items_data, order_status_data, errors = view.parse_order_request(data)
+    if errors:
+        return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+    lines, errors = view.parse_cart(order_items_data)
+    if errors:
+        return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+    products = {product.pk: product async for product in view.cart_products(lines)}
+    lines, errors = view.match_cart(lines, products)
+    if errors:
+        return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    # the async ORM has no transactions, write the order in one thread like the sync view
+    try:
+        order = await sync_to_async(view.save_order)(user, lines, order_status_data)
+    except exceptions.ValidationError as exc:
+        return json_response(exc.detail, status=exc.status_code)
+    return json_response(order.uuid, status=status.HTTP_201_CREATED)
@@ -0,0 +1,80 @@
+"""
+Typed attribute store extracted from Product.detail.
+
+``{"cpu": "i7-13620H", "ram": 16, "display": {"size": 15.6}, "ports": ["usb-c", "hdmi"]}``
+becomes rows (cpu, "i7-13620H"), (ram, "16", 16), (display.size, "15.6", 15.6),
+(ports, "usb-c"), (ports, "hdmi"). ``value`` is always set (exact match filters),
+``number`` only for numeric values (range filters and sorting).
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import Product, ProductAttribute
+
+MAX_KEY_LENGTH = 50
+MAX_VALUE_LENGTH = 100
+MAX_NUMBER = Decimal('1e10')  # DecimalField(max_digits=14, decimal_places=4)
+
+
+def to_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)[:MAX_VALUE_LENGTH]
+
+
+def to_number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    if not number.is_finite() or abs(number) >= MAX_NUMBER:
+        return None
+    return number.quantize(Decimal('0.0001'))
+
+
+def flatten(detail, prefix=''):
+    """Yield (key, value) pairs for every scalar in ``detail``."""
+    if isinstance(detail, dict):
+        for key, value in detail.items():
+            yield from flatten(value, '%s%s.' % (prefix, key))
+    elif isinstance(detail, (list, tuple)):
+        for value in detail:
+            yield from flatten(value, prefix)
+    elif detail is not None and prefix:
+        yield prefix[:-1][:MAX_KEY_LENGTH], detail
+
+
+def build_attributes(product, attribute_model=ProductAttribute):
+    return [attribute_model(product_id=product.pk, key=key, value=to_value(value), number=to_number(value))
+            for key, value in flatten(product.detail)]
+
+
+def sync_product(product):
+    with transaction.atomic():
+        ProductAttribute.objects.filter(product_id=product.pk).delete()
+        ProductAttribute.objects.bulk_create(build_attributes(product))
+
+
+def backfill(batch_size=500, product_model=Product, attribute_model=ProductAttribute, log=None):
+    """
+    Rebuild the attributes of every product, ``batch_size`` products per
+    transaction (keyset on id). Returns the number of products processed.
+    """
+    last_id = 0
+    count = 0
+    while True:
+        products = list(product_model.objects.filter(id__gt=last_id).order_by('id')
+                        .only('id', 'detail')[:batch_size])
+        if not products:
+            return count
+        with transaction.atomic():
+            attribute_model.objects.filter(product_id__in=[p.pk for p in products]).delete()
+            attribute_model.objects.bulk_create(
+                [a for p in products for a in build_attributes(p, attribute_model)], batch_size=1000)
+        count += len(products)
+        last_id = products[-1].pk
+        if log:
+            log(count)
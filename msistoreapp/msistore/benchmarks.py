@@ -0,0 +1,572 @@
+"""
+Benchmark scenarios, run with ``python manage.py benchmark [scenario ...]``.
+
+A scenario is a function registered with ``@scenario`` that receives the command
+options and returns a dict ``{label: timings}``; ``measure`` produces the timings.
+The command runs everything against a throw-away test database and prints a
+JSON report (results plus database, versions and row counts) that can be saved
+with ``--output`` and checked against an earlier run with ``--compare``:
+
+    python manage.py benchmark serializers endpoints --output before.json
+    python manage.py benchmark serializers endpoints --compare before.json
+"""
+import asyncio
+import io
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .models import Category, Order, Product, User
+from .filters import ProductFilter, order_by_attribute
+from . import exports, search, synthetic
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def measure(func, repeat=20):
+    """Call ``func`` ``repeat`` times and return latency statistics in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'runs': repeat,
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+    }
+
+
+SEARCH_KEYWORDS = ['gaming', 'msi katana', 'rtx 4060', 'ryzen', 'stealth white', 'pro']
+
+
+@scenario('search')
+def bench_search(options):
+    synthetic.ensure_catalogue(options['products'])
+    results = {}
+    for kw in SEARCH_KEYWORDS:
+        results['contains "%s"' % kw] = measure(
+            lambda: list(Product.objects.filter(name__contains=kw, description__contains=kw)[:100]),
+            options['repeat'])
+        results['index "%s"' % kw] = measure(
+            lambda: list(search.search(Product.objects.all(), kw)[:100]),
+            options['repeat'])
+    return results
+
+
+@scenario('orders')
+def bench_create_order(options):
+    synthetic.ensure_catalogue(max(options['products'] // 100, 100))
+    client = APIClient()
+    client.force_authenticate(synthetic.ensure_customer())
+    product_ids = list(Product.objects.values_list('id', flat=True)[:100])
+    order_status = json.dumps({'delivery_method': 'ship', 'delivery_stage': 'pending', 'payment_method': 'cash'})
+
+    results = {}
+    for lines in (1, 10, 100):
+        cart = json.dumps([{'id': product_id, 'quantity': 1} for product_id in product_ids[:lines]])
+
+        def create():
+            response = client.post('/order/create/', {'order_items': cart, 'order_status': order_status})
+            assert response.status_code == 201, response.content
+
+        stats = measure(create, options['repeat'])
+        stats['orders_per_s'] = round(1000 / stats['mean_ms'], 1)
+        results['%d-line cart' % lines] = stats
+    return results
+
+
+def count_queries(func):
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+@scenario('receipts')
+def bench_receipts(options):
+    synthetic.ensure_catalogue(max(options['products'] // 100, 100))
+    client = APIClient()
+    results = {}
+    for orders in (10, 100, 1000):
+        user = synthetic.ensure_customer('receipts-%d' % orders)
+        missing = orders - Order.objects.filter(user_id=user.pk).count()
+        if missing > 0:
+            synthetic.generate_orders(user, missing)
+        client.force_authenticate(user)
+        for label, url in (('all', '/order/get-receipt/'), ('page', '/order/get-receipt/?page=1&page_size=20')):
+            def get():
+                response = client.get(url)
+                assert response.status_code == 200, response.content
+
+            stats = measure(get, options['repeat'])
+            stats['queries'] = count_queries(get)
+            results['%d orders, %s' % (orders, label)] = stats
+    return results
+
+
+@scenario('export')
+def bench_export(options):
+    synthetic.ensure_catalogue(options['products'])
+    total = Product.objects.count()
+    results = {}
+    for output in sorted(exports.CONTENT_TYPES):
+        tracemalloc.start()
+        start = time.perf_counter()
+        size = sum(len(line) for line in exports.export_lines(output))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[output] = {
+            'products': total,
+            'seconds': round(elapsed, 3),
+            'products_per_s': round(total / elapsed, 1),
+            'bytes': size,
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+    return results
+
+
+def product_filter_combinations():
+    category_id = Category.objects.order_by('id').values_list('id', flat=True).first()
+    return {
+        'no filter': {},
+        'cateId': {'cateId': category_id},
+        'fromPrice': {'fromPrice': 500},
+        'fromPrice+toPrice': {'fromPrice': 500, 'toPrice': 1500},
+        'cateId+fromPrice+toPrice': {'cateId': category_id, 'fromPrice': 500, 'toPrice': 1500},
+        'kw': {'kw': 'gaming'},
+        'kw+cateId': {'kw': 'gaming', 'cateId': category_id},
+        'kw+cateId+fromPrice+toPrice': {'kw': 'gaming', 'cateId': category_id, 'fromPrice': 500, 'toPrice': 1500},
+    }
+
+
+@scenario('filters')
+def bench_product_filters(options):
+    from .views import ProductViewSet
+
+    synthetic.ensure_catalogue(options['products'])
+    client = APIClient()
+    view = ProductViewSet()
+    results = {}
+    for label, params in product_filter_combinations().items():
+        def get():
+            response = client.get('/products/', params)
+            assert response.status_code == 200, response.content
+
+        stats = measure(get, options['repeat'])
+        queryset = view.filter_products(Product.objects.order_by('id'), {k: str(v) for k, v in params.items()})
+        stats['explain'] = queryset[:100].explain().splitlines()
+        results[label] = stats
+    return results
+
+
+@scenario('facets')
+def bench_facets(options):
+    synthetic.ensure_catalogue(options['products'])
+    client = APIClient()
+    category_id = Category.objects.order_by('id').values_list('id', flat=True).first()
+    combinations = {
+        'no filter': {},
+        'cateId': {'cateId': category_id},
+        'brandId+price bucket': {'brandId': '1,2', 'price': '500-1000,1000-2000'},
+        'attr.ram+attr.gpu': {'attr.ram': '16,32', 'attr.gpu': 'RTX 4060'},
+        'kw+cateId+attr.cpu': {'kw': 'gaming', 'cateId': category_id, 'attr.cpu': 'i7-13620H'},
+    }
+    results = {}
+    for label, params in combinations.items():
+        for facets in (False, True):
+            query = dict(params, facets='true') if facets else params
+
+            def get():
+                response = client.get('/products/', query)
+                assert response.status_code == 200, response.content
+
+            stats = measure(get, options['repeat'])
+            stats['queries'] = count_queries(get)
+            results['%s%s' % (label, ', with facets' if facets else '')] = stats
+    return results
+
+
+@scenario('attributes')
+def bench_attributes(options):
+    synthetic.ensure_catalogue(options['products'])
+    products = Product.objects.order_by('id')
+    cases = {
+        'ram=16': ({'detail__ram': 16}, {'attr.ram': '16'}),
+        'gpu=RTX 4060 & ram>=32': ({'detail__gpu': 'RTX 4060', 'detail__ram__gte': 32},
+                                   {'attr.gpu': 'RTX 4060', 'attr.ram.min': '32'}),
+    }
+    results = {}
+    for label, (json_lookups, params) in cases.items():
+        results['%s, JSON scan' % label] = measure(lambda: list(products.filter(**json_lookups)[:100]),
+                                                   options['repeat'])
+        results['%s, attribute index' % label] = measure(
+            lambda: list(ProductFilter(params).filter(products)[:100]), options['repeat'])
+    results['sort by weight, JSON'] = measure(lambda: list(products.order_by('detail__weight')[:100]),
+                                              options['repeat'])
+    results['sort by weight, attribute index'] = measure(
+        lambda: list(order_by_attribute(products, 'attr.weight')[:100]), options['repeat'])
+    return results
+
+
+@scenario('fields')
+def bench_product_fields(options):
+    synthetic.ensure_catalogue(options['products'])
+    client = APIClient()
+    cases = {
+        'list': {},
+        'list, ?fields=id,name,new_price': {'fields': 'id,name,new_price'},
+        'list, ?fields=id,name,images': {'fields': 'id,name,images'},
+        'grid': {'view': 'grid'},
+        'detail': None,
+    }
+    product_id = Product.objects.order_by('id').values_list('id', flat=True).first()
+    results = {}
+    for label, params in cases.items():
+        url, params = ('/products/', params) if params is not None else ('/products/%d/' % product_id, {})
+
+        def get():
+            response = client.get(url, params)
+            assert response.status_code == 200, response.content
+            return response
+
+        stats = measure(get, options['repeat'])
+        stats['queries'] = count_queries(get)
+        stats['bytes'] = len(get().content)
+        results[label] = stats
+
+    # the full serializer (before the list / detail split) vs ProductListSerializer on one page, serialization only
+    from .serializers import ProductListSerializer, ProductSerializer
+    from .views import ProductViewSet
+    request = Request(APIRequestFactory().get('/products/'))
+    page = list(ProductSerializer.setup_eager_loading(Product.objects.order_by('id'))
+                [:ProductViewSet.pagination_class.default_page_size])
+    for serializer_class in (ProductSerializer, ProductListSerializer):
+        def render():
+            return JSONRenderer().render(serializer_class(page, many=True, context={'request': request}).data)
+
+        stats = measure(render, options['repeat'])
+        stats['bytes'] = len(render())
+        results['serialize only, %s' % serializer_class.__name__] = stats
+    return results
+
+
+@scenario('render')
+def bench_render(options):
+    from .renderers import FastJSONParser, FastJSONRenderer
+    from .serializers import ProductListSerializer, ProductSerializer, ReceiptSerializer
+    from .views import OrderViewSet
+
+    synthetic.ensure_catalogue(options['products'])
+    user = synthetic.ensure_customer('render')
+    missing = 1000 - Order.objects.filter(user_id=user.pk).count()
+    if missing > 0:
+        synthetic.generate_orders(user, missing)
+
+    request = Request(APIRequestFactory().get('/'))
+    context = {'request': request}
+    products = ProductSerializer.setup_eager_loading(Product.objects.order_by('id'))
+    payloads = {
+        '100 products (list)': ProductListSerializer(products[:100], many=True, context=context).data,
+        '100 products (detail)': ProductSerializer(products[:100], many=True, context=context).data,
+        '1000 receipts': ReceiptSerializer(OrderViewSet().get_receipt_queryset().filter(user_id=user.pk),
+                                           many=True, context=context).data,
+    }
+    results = {}
+    for label, data in payloads.items():
+        expected = JSONRenderer().render(data)
+        body = FastJSONRenderer().render(data)
+        for name, renderer in (('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())):
+            stats = measure(lambda: renderer.render(data), options['repeat'])
+            stats['bytes'] = len(expected)
+            results['%s, render, %s' % (label, name)] = stats
+        results['%s, render, identical output' % label] = body == expected
+        for name, parser in (('JSONParser', JSONParser()), ('FastJSONParser', FastJSONParser())):
+            results['%s, parse, %s' % (label, name)] = measure(lambda: parser.parse(io.BytesIO(expected)),
+                                                              options['repeat'])
+    return results
+
+
+@scenario('fastpath')
+def bench_fastpath(options):
+    # /products/ through ProductListSerializer vs PRODUCT_LIST_FAST_PATH; identical output is checked by
+    # FastPathContractTests in msistore/tests.py
+    synthetic.ensure_catalogue(options['products'])
+    client = APIClient()
+    category_id = Category.objects.order_by('id').values_list('id', flat=True).first()
+    combinations = {
+        'no filter': {},
+        'page 3': {'page': 3},
+        'cateId+fromPrice+toPrice': {'cateId': category_id, 'fromPrice': 500, 'toPrice': 1500},
+        'kw': {'kw': 'gaming'},
+        'ordering=attr.weight': {'ordering': 'attr.weight'},
+        'cursor, ordering=price': {'cursor': '', 'ordering': 'price'},
+        'fields=id,name,new_price': {'fields': 'id,name,new_price'},
+        'fields=brand,images,image_size=thumb': {'fields': 'brand,images', 'image_size': 'thumb'},
+    }
+    results = {}
+    for label, params in combinations.items():
+        for fast_path in (False, True):
+            def get():
+                response = client.get('/products/', params)
+                assert response.status_code == 200, response.content
+
+            with override_settings(PRODUCT_LIST_FAST_PATH=fast_path):
+                stats = measure(get, options['repeat'])
+                stats['queries'] = count_queries(get)
+            results['%s, %s' % (label, 'fast path' if fast_path else 'serializer')] = stats
+    return results
+
+
+def access_token(user):
+    # OAuth2 token for the plain Client / AsyncClient (force_authenticate only exists on APIClient)
+    from datetime import timedelta
+
+    from django.utils import timezone
+    from oauth2_provider.models import AccessToken
+
+    token, _ = AccessToken.objects.get_or_create(user=user, token='benchmark-%d' % user.pk, defaults={
+        'expires': timezone.now() + timedelta(days=1), 'scope': 'read write'})
+    return token.token
+
+
+def load_stats(timings, elapsed):
+    return {
+        'requests': len(timings),
+        'requests_per_s': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+    }
+
+
+def sync_load(method, url, data, headers, concurrency, requests):
+    """``requests`` calls through the WSGI handler from ``concurrency`` threads."""
+    def call(_):
+        start = time.perf_counter()
+        response = getattr(Client(), method)(url, data, headers=headers)
+        assert response.status_code < 300, response.content
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        start = time.perf_counter()
+        timings = list(executor.map(call, range(requests)))
+        elapsed = time.perf_counter() - start
+        # close each thread's DB connection (every thread runs exactly 1 task)
+        barrier = threading.Barrier(concurrency)
+        list(executor.map(lambda _: (barrier.wait(), connection.close()), range(concurrency)))
+    return load_stats(timings, elapsed)
+
+
+def async_load(method, url, data, headers, concurrency, requests):
+    """``requests`` calls through the ASGI handler, at most ``concurrency`` in flight."""
+    async def run():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await getattr(client, method)(url, data, headers=headers)
+                assert response.status_code < 300, response.content
+                return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        timings = await asyncio.gather(*(call() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+        await sync_to_async(lambda: connection.close())()
+        return load_stats(timings, elapsed)
+
+    return asyncio.run(run())
+
+
+@scenario('async')
+def bench_async(options):
+    synthetic.ensure_catalogue(options['products'])
+    user = synthetic.ensure_customer('async')
+    missing = 100 - Order.objects.filter(user_id=user.pk).count()
+    if missing > 0:
+        synthetic.generate_orders(user, missing)
+    headers = {'Authorization': 'Bearer %s' % access_token(user)}
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:3])
+    order = {
+        'order_items': json.dumps([{'id': product_id, 'quantity': 1} for product_id in product_ids]),
+        'order_status': json.dumps({'delivery_method': 'ship', 'delivery_stage': 'pending', 'payment_method': 'cash'}),
+    }
+    endpoints = {
+        'products': ('get', '/products/', {'page_size': 20}),
+        'product detail': ('get', '/products/%d/' % product_ids[0], {}),
+        'receipts': ('get', '/order/get-receipt/', {'page': 1, 'page_size': 20}),
+        'create order': ('post', '/order/create/', order),
+    }
+    results = {}
+    # /async/products/ always uses the fast path, enable it for the sync version too so both serialize alike
+    with override_settings(PRODUCT_LIST_FAST_PATH=True):
+        for label, (method, url, data) in endpoints.items():
+            # SQLite locks the whole table on writes, only measure concurrent writes on MySQL
+            levels = (1,) if method == 'post' and connection.vendor == 'sqlite' else (1, 10, 50)
+            for concurrency in levels:
+                requests = options['repeat'] * concurrency
+                results['%s, WSGI x%d' % (label, concurrency)] = sync_load(
+                    method, url, data, headers, concurrency, requests)
+                results['%s, ASGI x%d' % (label, concurrency)] = async_load(
+                    method, '/async' + url, data, headers, concurrency, requests)
+    return results
+
+
+@scenario('connections')
+def bench_connections(options):
+    from . import dbstats
+
+    # send request_started / request_finished like a real handler (the test Client never closes connections)
+    synthetic.ensure_catalogue(100)
+    settings_dict = connection.settings_dict
+    original = settings_dict.get('CONN_MAX_AGE', 0)
+
+    def request():
+        request_started.send(sender=None)
+        list(Product.objects.order_by('id')[:20])
+        request_finished.send(sender=None)
+
+    results = {}
+    try:
+        for max_age in (0, 60):
+            settings_dict['CONN_MAX_AGE'] = max_age
+            connection.close()
+            before = dbstats.db_stats()['databases'][connection.alias]['connections_created']
+            stats = measure(request, options['repeat'] * 10)
+            stats['connections_created'] = \
+                dbstats.db_stats()['databases'][connection.alias]['connections_created'] - before
+            results['CONN_MAX_AGE=%d' % max_age] = stats
+    finally:
+        settings_dict['CONN_MAX_AGE'] = original
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        results['note'] = 'in-memory SQLite test databases are never closed; run against MySQL to compare'
+    return results
+
+
+def dataset(options):
+    """Top the benchmark database up to the row counts given on the command line."""
+    return synthetic.ensure_dataset(products=options['products'], images_per_product=options['images_per_product'],
+                                    users=options['users'], orders=options['orders'], likes=options['likes'],
+                                    seed=options['seed'])
+
+
+@scenario('serializers')
+def bench_serializers(options):
+    from .models import Brand, Image, Like, OrderItem, OrderSummary, StatusOrder, UserInfo
+    from .views import OrderViewSet
+    from . import serializers
+
+    dataset(options)
+    request = Request(APIRequestFactory().get('/'))
+    context = {'request': request}
+    size = 100
+    products = Product.objects.order_by('id')
+    # instances are loaded beforehand (eager loading like the views), only serialization is timed
+    cases = [
+        (serializers.BrandSerializer, Brand.objects.order_by('id')),
+        (serializers.CategorySerializer, Category.objects.order_by('id')),
+        (serializers.ImageSerializer, Image.objects.order_by('id')),
+        (serializers.ProductSerializer, serializers.ProductSerializer.setup_eager_loading(products)),
+        (serializers.ProductListSerializer, serializers.ProductSerializer.setup_eager_loading(products)),
+        (serializers.ProductGridSerializer, serializers.ProductGridSerializer.setup_eager_loading(products)),
+        (serializers.UserSerializer, User.objects.order_by('id')),
+        (serializers.UserInfoSerializer, UserInfo.objects.order_by('user_id')),
+        (serializers.LikeSerializer, Like.objects.order_by('id')),
+        (serializers.OrderSerializer, Order.objects.prefetch_related('products').order_by('id')),
+        (serializers.OrderItemSerializer, serializers.OrderItemSerializer.setup_eager_loading(
+            OrderItem.objects.order_by('id'))),
+        (serializers.StatusOrderSerializer, StatusOrder.objects.order_by('id')),
+        (serializers.OrderSummarySerializer, OrderSummary.objects.select_related('order').order_by('order_id')),
+        (serializers.ReceiptSerializer, OrderViewSet().get_receipt_queryset()),
+    ]
+    results = {}
+    for serializer_class, queryset in cases:
+        instances = list(queryset[:size])
+        if not instances:
+            continue
+
+        def serialize():
+            return serializer_class(instances, many=True, context=context).data
+
+        stats = measure(serialize, options['repeat'])
+        stats['objects'] = len(instances)
+        stats['us_per_object'] = round(stats['mean_ms'] * 1000 / len(instances), 1)
+        stats['queries'] = count_queries(serialize)
+        results[serializer_class.__name__] = stats
+    return results
+
+
+def endpoint_customer():
+    return User.objects.filter(username__startswith='customer-', userinfo__isnull=False).order_by('id').first() \
+        or synthetic.ensure_customer()
+
+
+def endpoint_requests():
+    """{label: (method, url, data)} of the requests timed by the endpoints scenario (also used by tests.py)."""
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True)[:3])
+    order = {
+        'order_items': json.dumps([{'id': product_id, 'quantity': 1} for product_id in product_ids]),
+        'order_status': json.dumps({'delivery_method': 'ship', 'delivery_stage': 'pending', 'payment_method': 'cash'}),
+    }
+    return {
+        'GET /products/': ('get', '/products/', {}),
+        'GET /products/?page=last&cateId': ('get', '/products/', {
+            'page': 'last', 'cateId': Category.objects.order_by('id').values_list('id', flat=True).first()}),
+        'GET /order/get-receipt/': ('get', '/order/get-receipt/', {}),
+        'GET /order/get-receipt/?page=1': ('get', '/order/get-receipt/', {'page': 1, 'page_size': 20}),
+        'POST /order/create/': ('post', '/order/create/', order),
+    }
+
+
+@scenario('endpoints')
+def bench_endpoints(options):
+    # latency (sequential) and throughput (several threads) through the whole middleware stack, real OAuth2 auth
+    dataset(options)
+    headers = {'Authorization': 'Bearer %s' % access_token(endpoint_customer())}
+    client = Client()
+    results = {}
+    for label, (method, url, data) in endpoint_requests().items():
+        def call():
+            response = getattr(client, method)(url, data, headers=headers)
+            assert response.status_code < 300, response.content
+            return response
+
+        stats = measure(call, options['repeat'])
+        stats['queries'] = count_queries(call)
+        stats['bytes'] = len(call().content)
+        results['%s, latency' % label] = stats
+        # SQLite locks the whole table on writes, only measure concurrent writes on MySQL
+        levels = (1,) if method == 'post' and connection.vendor == 'sqlite' else (1, 10)
+        for concurrency in levels:
+            results['%s, throughput x%d' % (label, concurrency)] = sync_load(
+                method, url, data, headers, concurrency, options['repeat'] * concurrency)
+    return results
@@ -0,0 +1,167 @@
+"""
+Response cache for the catalogue read endpoints.
+
+Cached responses are grouped in namespaces ('products', 'categories', 'brands').
+Each namespace has a version stored in the cache; signals bump it whenever a
+model the namespace depends on is saved or deleted, so old entries are simply
+never read again (no key scanning needed).
+
+Versions only work if every process sees the same ones, so both the response
+cache and the validators below are disabled unless the default cache is shared
+(Redis, Memcached, database...). With the per-process LocMem cache a change
+made by another worker, the admin or a management command would never bump
+this process's versions, and it would keep serving old bodies and 304s.
+
+The same versions drive HTTP conditional requests: the ETag of a response is a
+hash of the namespace version and the request signature, and Last-Modified is
+the time of the last bump, so If-None-Match / If-Modified-Since can be answered
+with 304 before the view touches the database.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+from . import db_routers
+
+VERSION_KEY = 'catalogue:version:%s'
+RESPONSE_KEY = 'catalogue:response:%s:%s:%s'
+STATS_KEY = 'catalogue:stats:%s:%s'
+
+NAMESPACES = ('products', 'categories', 'brands')
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache():
+    """
+    Whether catalogue versions can be trusted across processes: settings.CATALOGUE_CACHE_SHARED,
+    or when it is None, whether the default cache backend is not process-local.
+    """
+    shared = getattr(settings, 'CATALOGUE_CACHE_SHARED', None)
+    if shared is None:
+        shared = settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+    return shared
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def get_version(namespace):
+    # the version is the timestamp (ms) of the last change, initialised to the current time
+    # so that after the cache is cleared a new version never equals an old one
+    version = cache.get(VERSION_KEY % namespace)
+    if version is None:
+        version = _now_ms()
+        if not cache.add(VERSION_KEY % namespace, version, None):
+            version = cache.get(VERSION_KEY % namespace, version)
+    return version
+
+
+def bump_version(namespace):
+    # Last-Modified has whole-second precision: move to the next whole second after both the old
+    # version and now, so a client holding the old Last-Modified never gets a 304 for the new data
+    old = cache.get(VERSION_KEY % namespace) or 0
+    version = max(old // 1000 + 1, -(-_now_ms() // 1000)) * 1000
+    cache.set(VERSION_KEY % namespace, version, None)
+
+
+def request_signature(request):
+    params = sorted((k, v) for k in request.query_params for v in request.query_params.getlist(k))
+    raw = '%s|%s|%s' % (request.get_host(), request.path, params)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def response_cache_key(request, namespace):
+    return RESPONSE_KEY % (namespace, get_version(namespace), request_signature(request))
+
+
+def _record(namespace, outcome):
+    key = STATS_KEY % (namespace, outcome)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # the key was evicted between add and incr
+        cache.set(key, 1, None)
+
+
+def cache_stats():
+    stats = {}
+    for namespace in NAMESPACES:
+        hits = cache.get(STATS_KEY % (namespace, 'hit'), 0)
+        misses = cache.get(STATS_KEY % (namespace, 'miss'), 0)
+        total = hits + misses
+        stats[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+    return stats
+
+
+def _maybe_stale(namespace):
+    # read from a replica right after the data changed: it may not have the change yet, do not cache it
+    if not db_routers.read_replica():
+        return False
+    return _now_ms() - get_version(namespace) < settings.REPLICA_MAX_LAG * 1000
+
+
+def cache_response(namespace):
+    """
+    Decorator for viewset GET actions: serve ``response.data`` from the cache,
+    keyed by host, path and normalized query params, and mark it with X-Cache.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(self, request, *args, **kwargs):
+            timeout = getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 0)
+            if not timeout or request.method != 'GET' or not shared_cache():
+                return view_func(self, request, *args, **kwargs)
+
+            key = response_cache_key(request, namespace)
+            data = cache.get(key)
+            if data is not None:
+                _record(namespace, 'hit')
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = view_func(self, request, *args, **kwargs)
+            _record(namespace, 'miss')
+            if response.status_code == 200 and not _maybe_stale(namespace):
+                cache.set(key, response.data, timeout)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_response(namespace):
+    """
+    Decorator for viewset GET actions adding ETag / Last-Modified and answering
+    If-None-Match / If-Modified-Since with 304 Not Modified. Without a shared
+    cache no validator is sent and every request gets a full response.
+    """
+    def etag_func(request, *args, **kwargs):
+        if not shared_cache():
+            return None
+        raw = '%s:%s' % (get_version(namespace), request_signature(request))
+        return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        if not shared_cache():
+            return None
+        return datetime.fromtimestamp(get_version(namespace) / 1000, tz=timezone.utc)
+
+    return method_decorator(condition(etag_func=etag_func, last_modified_func=last_modified_func))
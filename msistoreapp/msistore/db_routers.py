@@ -0,0 +1,198 @@
+"""
+Read-replica routing.
+
+Reads made while handling a safe request (GET/HEAD/OPTIONS) go to one of
+``settings.DATABASE_REPLICAS``; everything else (writes, unsafe requests,
+management commands, upload workers) uses ``default``. After a write the user
+is pinned to the primary for ``REPLICA_PIN_SECONDS``, so e.g. get_receipt right
+after create_order sees the new order. Replicas lagging more than
+``REPLICA_MAX_LAG`` seconds, or failing the lag check, are skipped.
+
+The pin is kept on the server, in the default cache under the user id: API
+clients authenticate with OAuth2 bearer tokens and do not keep cookies, and the
+pin has to follow the user to any worker, so the cache must be shared (Redis)
+in production. The user is only known once DRF has authenticated the request,
+inside the view, so the router checks the pin lazily on the first read after
+that; the token lookup itself may still use a replica.
+"""
+import contextvars
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+PIN_KEY = 'db:pin_primary:%s'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RequestState:
+    # mutable, so changes made by the view in a sync_to_async thread are seen by the middleware
+
+    def __init__(self, request):
+        self.request = request
+        self.use_replica = request.method in SAFE_METHODS
+        self.wrote = False
+        self.read_replica = False
+        self.pinned = None  # None = not checked yet
+
+
+# None = outside a request (command, worker) -> always the primary
+_state = contextvars.ContextVar('replica_request_state', default=None)
+
+_lag_lock = threading.Lock()
+_lag_cache = {}  # alias -> (checked_at, lag in seconds or None on error)
+
+
+def _replica_status(connection, statement):
+    with connection.cursor() as cursor:
+        cursor.execute(statement)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+
+def replica_lag(alias):
+    """Replication delay of ``alias`` in seconds, or None when it cannot be read."""
+    connection = connections[alias]
+    try:
+        if connection.vendor != 'mysql':
+            # SQLite... (dev/test) has no replication
+            connection.ensure_connection()
+            return 0
+        try:
+            # MySQL 8.0.22+ / MariaDB 10.5.1+; SHOW SLAVE STATUS is gone in MySQL 8.4
+            status = _replica_status(connection, 'SHOW REPLICA STATUS')
+        except DatabaseError:
+            status = _replica_status(connection, 'SHOW SLAVE STATUS')
+        if status is None:
+            return 0
+        return status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    except DatabaseError:
+        return None
+
+
+def cached_replica_lag(alias):
+    # check the lag at most once per REPLICA_LAG_CHECK_INTERVAL seconds per process
+    now = time.monotonic()
+    with _lag_lock:
+        checked_at, lag = _lag_cache.get(alias, (None, None))
+    if checked_at is None or now - checked_at >= settings.REPLICA_LAG_CHECK_INTERVAL:
+        lag = replica_lag(alias)
+        with _lag_lock:
+            _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def healthy_replicas():
+    return [alias for alias in settings.DATABASE_REPLICAS
+            if (lag := cached_replica_lag(alias)) is not None and lag <= settings.REPLICA_MAX_LAG]
+
+
+def read_replica():
+    # whether the current request read from a replica (its response may be up to REPLICA_MAX_LAG seconds old)
+    state = _state.get()
+    return state is not None and state.read_replica
+
+
+def authenticated_user_id(request):
+    """
+    Id of the user DRF authenticated (its Request sets ``request.user`` on the
+    HttpRequest too), or None. AuthenticationMiddleware's lazy user is not
+    evaluated: that would run a session query from inside the router.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    return user.pk if user.is_authenticated else None
+
+
+def pin_to_primary(user_id):
+    cache.set(PIN_KEY % user_id, 1, settings.REPLICA_PIN_SECONDS)
+
+
+def _pinned(state):
+    if state.pinned is None:
+        user_id = authenticated_user_id(state.request)
+        if user_id is None:
+            return False
+        state.pinned = cache.get(PIN_KEY % user_id) is not None
+    return state.pinned
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or state.wrote or _pinned(state):
+            return DEFAULT_DB_ALIAS
+        replicas = healthy_replicas()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        state.read_replica = True
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # a write in a request -> later reads of this request and of the user's next requests use the primary
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the primary and the replicas hold the same data
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinningMiddleware:
+    """Enable replica reads for safe, unpinned requests and pin the user after a write."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestState(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        user_id = self.pin_user_id(request, state)
+        if user_id is not None:
+            pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        user_id = self.pin_user_id(request, state)
+        if user_id is not None:
+            await cache.aset(PIN_KEY % user_id, 1, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    @staticmethod
+    def pin_user_id(request, state):
+        if request.method not in SAFE_METHODS or state.wrote:
+            return authenticated_user_id(request)
+        return None
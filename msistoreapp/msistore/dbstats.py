@@ -0,0 +1,72 @@
+"""
+Database connection instrumentation, reported by /stats/db/.
+
+Counters are kept per process (each WSGI/ASGI worker holds its own
+connections): requests started and connections opened per database alias,
+fed by the request_started / connection_created signals (see signals.py).
+With persistent connections (CONN_MAX_AGE) ``connections_created`` stays far
+below ``requests``; with the optional pool (DB_POOL=1) the QueuePool status of
+django-db-connection-pool is reported too.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+from . import db_routers
+
+_lock = threading.Lock()
+_requests = 0
+_connections_created = {}
+
+
+def record_request():
+    global _requests
+    with _lock:
+        _requests += 1
+
+
+def record_connection(alias):
+    with _lock:
+        _connections_created[alias] = _connections_created.get(alias, 0) + 1
+
+
+def pool_status(alias):
+    # only when ENGINE is dj_db_conn_pool.backends.*; the pool is created with the first connection
+    try:
+        from dj_db_conn_pool.core import pool_container
+        pool = pool_container[alias]
+    except (ImportError, KeyError):
+        return None
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+    }
+
+
+def db_stats():
+    with _lock:
+        requests = _requests
+        created = dict(_connections_created)
+    stats = {'pid': os.getpid(), 'requests': requests, 'databases': {}}
+    for alias in connections:
+        settings_dict = connections.settings[alias]
+        opened = created.get(alias, 0)
+        stats['databases'][alias] = {
+            'engine': settings_dict['ENGINE'],
+            'conn_max_age': settings_dict.get('CONN_MAX_AGE', 0),
+            'conn_health_checks': settings_dict.get('CONN_HEALTH_CHECKS', False),
+            'connections_created': opened,
+            'requests_per_connection': round(requests / opened, 2) if opened else None,
+            'pool': pool_status(alias),
+        }
+        if alias in settings.DATABASE_REPLICAS:
+            lag = db_routers.cached_replica_lag(alias)
+            stats['databases'][alias]['replica'] = {
+                'lag_seconds': lag,
+                'healthy': lag is not None and lag <= settings.REPLICA_MAX_LAG,
+            }
+    return stats
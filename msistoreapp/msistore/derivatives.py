@@ -0,0 +1,42 @@
+"""
+Resized variants of product images, generated by the upload worker from the
+staged original. Stored as WebP when Pillow supports it, JPEG otherwise.
+"""
+import os
+
+from PIL import Image as PILImage, ImageOps, features
+
+# name -> longest side (px)
+SIZES = {
+    'thumb': 200,
+    'medium': 600,
+    'large': 1200,
+}
+
+
+def output_format():
+    return ('WEBP', '.webp') if features.check('webp') else ('JPEG', '.jpg')
+
+
+def make_derivatives(path):
+    """Write one resized copy of ``path`` per size next to it; return {size: path}."""
+    image_format, extension = output_format()
+    base = os.path.splitext(path)[0]
+    paths = {}
+    try:
+        with PILImage.open(path) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ('RGB', 'RGBA') or (image_format == 'JPEG' and original.mode == 'RGBA'):
+                original = original.convert('RGB')
+            for size, edge in SIZES.items():
+                variant = original.copy()
+                variant.thumbnail((edge, edge))
+                paths[size] = '%s_%s%s' % (base, size, extension)
+                variant.save(paths[size], image_format, quality=80)
+    except Exception:
+        # no half-written set of variants left next to the staged file
+        for variant_path in paths.values():
+            if os.path.exists(variant_path):
+                os.remove(variant_path)
+        raise
+    return paths
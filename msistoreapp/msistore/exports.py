@@ -0,0 +1,86 @@
+"""
+Streaming export of the product catalogue (NDJSON or CSV).
+
+Products are read in keyset chunks (``id > last_id ORDER BY id LIMIT n``), and
+the images of each chunk are loaded with one extra query, so memory stays
+constant and the query count is ~2 per chunk whatever the catalogue size.
+"""
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Image, Product, UploadStatus
+
+FIELDS = ['id', 'name', 'description', 'detail', 'old_price', 'new_price', 'category', 'category_name', 'brand',
+          'brand_name', 'images', 'is_active']
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+_PRODUCT_VALUES = ['id', 'name', 'description', 'detail', 'old_price', 'new_price', 'category_id', 'category__name',
+                   'brand_id', 'brand__name', 'is_active']
+
+
+def iter_products(queryset=None, chunk_size=1000):
+    """Yield one export dict per product, images ordered preview first."""
+    queryset = (queryset if queryset is not None else Product.objects.all()).order_by('id')
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).values(*_PRODUCT_VALUES)[:chunk_size])
+        if not rows:
+            return
+        images = {}
+        for product_id, file, preview in Image.objects.filter(product_id__in=[r['id'] for r in rows],
+                                                              upload_status=UploadStatus.DONE) \
+                .order_by('-preview', 'id').values_list('product_id', 'file', 'preview'):
+            images.setdefault(product_id, []).append(file)
+        for row in rows:
+            yield {
+                'id': row['id'],
+                'name': row['name'],
+                'description': row['description'],
+                'detail': row['detail'],
+                'old_price': row['old_price'],
+                'new_price': row['new_price'],
+                'category': row['category_id'],
+                'category_name': row['category__name'],
+                'brand': row['brand_id'],
+                'brand_name': row['brand__name'],
+                'images': images.get(row['id'], []),
+                'is_active': row['is_active'],
+            }
+        last_id = rows[-1]['id']
+
+
+def ndjson_lines(products):
+    for product in products:
+        yield json.dumps(product, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def csv_lines(products):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return value
+
+    writer.writeheader()
+    yield flush()
+    for product in products:
+        row = dict(product)
+        row['detail'] = json.dumps(row['detail'], ensure_ascii=False)
+        row['images'] = ' '.join(row['images'])
+        writer.writerow(row)
+        yield flush()
+
+
+def export_lines(output, queryset=None, chunk_size=1000):
+    products = iter_products(queryset, chunk_size=chunk_size)
+    return csv_lines(products) if output == 'csv' else ndjson_lines(products)
@@ -0,0 +1,79 @@
+"""
+Serializer-free product list, enabled with ``PRODUCT_LIST_FAST_PATH``.
+
+Rows are read with ``.values()`` and their images with one batched query, then
+turned into dicts with the ``to_representation`` of the ProductListSerializer
+fields, so the JSON is byte-identical to the serializer path (checked by
+``python manage.py benchmark fastpath``). Only model fields and ``images`` are
+handled, which is all ProductListSerializer declares.
+"""
+from rest_framework.relations import RelatedField
+
+from .models import Image, UploadStatus
+from .serializers import ProductListSerializer, absolute_image_url, image_size
+
+
+def list_fields(fields=None):
+    # fields of ProductListSerializer after the ?fields= filter, in the serializer's output order
+    return ProductListSerializer(fields=fields).fields
+
+
+def column(field):
+    # foreign keys are output as ids -> read the <name>_id column directly, no join
+    return field.source + '_id' if isinstance(field, RelatedField) else field.source
+
+
+def product_values(queryset, fields):
+    columns = {column(field) for name, field in fields.items() if name != 'images'}
+    # id for the images, new_price for the cursor key of ProductCursorPagination (?ordering=price)
+    return queryset.prefetch_related(None).values('id', 'new_price', *columns)
+
+
+def image_rows(product_ids, request):
+    size = image_size(request)
+    variant = '%s_url' % size if size else 'file'
+    return Image.objects.filter(product_id__in=product_ids, upload_status=UploadStatus.DONE) \
+        .order_by('id').values_list('product_id', 'file', 'preview', variant)
+
+
+def group_images(rows, request):
+    images = {}
+    for product_id, file, preview, variant_file in rows:
+        images.setdefault(product_id, []).append((preview, variant_file or file))
+    # preview first, like ProductSerializer.get_images
+    return {
+        product_id: [absolute_image_url(file, preview, request)
+                     for preview, file in sorted(product_images, key=lambda image: not image[0])]
+        for product_id, product_images in images.items()
+    }
+
+
+def product_images(product_ids, request):
+    return group_images(image_rows(product_ids, request), request)
+
+
+def serialize_products(rows, request, fields, images=None):
+    # images: {product_id: [url]} already loaded (async view), None = load them here
+    rows = list(rows)
+    if images is None and 'images' in fields:
+        images = product_images([row['id'] for row in rows], request)
+    converters = []
+    for name, field in fields.items():
+        if name == 'images':
+            converters.append((name, None, None))
+        elif isinstance(field, RelatedField):
+            converters.append((name, column(field), None))
+        else:
+            converters.append((name, column(field), field.to_representation))
+
+    data = []
+    for row in rows:
+        item = {}
+        for name, key, to_representation in converters:
+            if key is None:
+                item[name] = images.get(row['id'], [])
+                continue
+            value = row[key]
+            item[name] = value if value is None or to_representation is None else to_representation(value)
+        data.append(item)
+    return data
@@ -0,0 +1,183 @@
+"""
+Faceted filtering for ProductViewSet.list.
+
+Query params (all optional, lists are comma separated or repeated):
+    cateId=1,2          categories
+    brandId=3,4         brands
+    fromPrice/toPrice   price range (fromPrice alone means new_price > fromPrice)
+    price=0-500,2000-   price buckets, see PRICE_BUCKETS
+    attr.<key>=a,b      value of ``<key>`` in Product.detail, e.g. attr.cpu=i7-13620H
+    attr.<key>.min/.max numeric range on ``<key>``, e.g. attr.ram.min=16
+    ordering=price      sort by new_price (-price descending), also with ?cursor
+    ordering=attr.<key> sort by a numeric attribute (-attr.<key> descending), not with ?cursor
+    facets=true         add per-facet counts to the response
+    facetAttr=cpu,ram   with facets=true, also count the values of these attributes
+                        (attributes filtered with attr.<key> are always counted)
+
+Facet counts are disjunctive: the counts of a facet apply every filter except
+that facet's own, so the sidebar shows what selecting another value would give.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, F, FilteredRelation, Min, Q
+
+from .models import ProductAttribute
+from . import search
+
+# (key, from, to): from <= new_price < to, to = None means no upper bound
+PRICE_BUCKETS = [
+    ('0-500', Decimal('0'), Decimal('500')),
+    ('500-1000', Decimal('500'), Decimal('1000')),
+    ('1000-2000', Decimal('1000'), Decimal('2000')),
+    ('2000-5000', Decimal('2000'), Decimal('5000')),
+    ('5000-', Decimal('5000'), None),
+]
+
+ATTRIBUTE_PREFIX = 'attr.'
+FACETS = ('category', 'brand', 'price')
+# attribute facets per request, one GROUP BY each
+MAX_ATTRIBUTE_FACETS = 10
+
+
+def _get_list(params, name):
+    getlist = getattr(params, 'getlist', None)
+    values = getlist(name) if getlist else [params[name]] if name in params else []
+    return [v.strip() for value in values for v in str(value).split(',') if v.strip()]
+
+
+def _get_ids(params, name):
+    return [int(v) for v in _get_list(params, name) if v.isdigit()]
+
+
+def _bucket_q(lower, upper):
+    q = Q(new_price__gte=lower)
+    if upper is not None:
+        q &= Q(new_price__lt=upper)
+    return q
+
+
+def _parse_decimal(value):
+    try:
+        value = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return value if value.is_finite() else None
+
+
+class ProductFilter:
+
+    def __init__(self, params):
+        self.params = params
+        self.categories = _get_ids(params, 'cateId')
+        self.brands = _get_ids(params, 'brandId')
+        self.from_price = _parse_decimal(params.get('fromPrice'))
+        self.to_price = _parse_decimal(params.get('toPrice'))
+        buckets = dict((key, (lower, upper)) for key, lower, upper in PRICE_BUCKETS)
+        self.price_buckets = [buckets[key] for key in _get_list(params, 'price') if key in buckets]
+        self.attributes = {}
+        self.attribute_ranges = {}
+        for name in params:
+            if not name.startswith(ATTRIBUTE_PREFIX):
+                continue
+            key = name[len(ATTRIBUTE_PREFIX):]
+            if key.endswith(('.min', '.max')):
+                key, bound = key[:-4], key[-3:]
+                value = _parse_decimal(params.get(name))
+                if key and value is not None:
+                    lower, upper = self.attribute_ranges.get(key, (None, None))
+                    self.attribute_ranges[key] = (value, upper) if bound == 'min' else (lower, value)
+            elif key and _get_list(params, name):
+                self.attributes[key] = _get_list(params, name)
+        self.kw = params.get('kw')
+        keys = [*self.attributes, *self.attribute_ranges, *_get_list(params, 'facetAttr')]
+        self.attribute_facets = list(dict.fromkeys(keys))[:MAX_ATTRIBUTE_FACETS]
+
+    def facet_filters(self):
+        """Return {facet: Q} for every active filter; 'kw' and attributes are facets too."""
+        filters = {}
+        if self.categories:
+            filters['category'] = Q(category_id__in=self.categories)
+        if self.brands:
+            filters['brand'] = Q(brand_id__in=self.brands)
+
+        price = Q()
+        if self.from_price is not None and self.to_price is not None:
+            price &= Q(new_price__range=(self.from_price, self.to_price))
+        elif self.from_price is not None:
+            price &= Q(new_price__gt=self.from_price)
+        if self.price_buckets:
+            buckets = Q()
+            for lower, upper in self.price_buckets:
+                buckets |= _bucket_q(lower, upper)
+            price &= buckets
+        if price:
+            filters['price'] = price
+
+        for key, values in self.attributes.items():
+            filters[ATTRIBUTE_PREFIX + key] = self.attribute_q(key, value__in=values)
+        for key, (lower, upper) in self.attribute_ranges.items():
+            bounds = {}
+            if lower is not None:
+                bounds['number__gte'] = lower
+            if upper is not None:
+                bounds['number__lte'] = upper
+            filters[ATTRIBUTE_PREFIX + key + '.range'] = self.attribute_q(key, **bounds)
+        if self.kw:
+            filters['kw'] = search.match_q(self.kw)
+        return filters
+
+    def attribute_q(self, key, **lookups):
+        # uses the ProductAttribute table (indexes key, value / key, number) instead of reading the JSON of every row
+        return Q(pk__in=ProductAttribute.objects.filter(key=key, **lookups).values('product_id'))
+
+    def filter(self, queryset, exclude=None):
+        for facet, q in self.facet_filters().items():
+            if facet != exclude:
+                queryset = queryset.filter(q)
+        return queryset
+
+    def facet_counts(self, queryset):
+        """Per-facet counts with one GROUP BY / aggregate query per facet."""
+        categories = self.filter(queryset, exclude='category').order_by() \
+            .values('category_id', 'category__name').annotate(count=Count('id')).order_by('category_id')
+        brands = self.filter(queryset, exclude='brand').order_by() \
+            .filter(brand__isnull=False).values('brand_id', 'brand__name').annotate(count=Count('id')) \
+            .order_by('brand_id')
+        prices = self.filter(queryset, exclude='price').order_by().aggregate(**{
+            key: Count('id', filter=_bucket_q(lower, upper)) for key, lower, upper in PRICE_BUCKETS
+        })
+        facets = {
+            'category': [{'id': c['category_id'], 'name': c['category__name'], 'count': c['count']}
+                         for c in categories],
+            'brand': [{'id': b['brand_id'], 'name': b['brand__name'], 'count': b['count']} for b in brands],
+            'price': [{'key': key, 'from': str(lower), 'to': str(upper) if upper is not None else None,
+                       'count': prices[key]}
+                      for key, lower, upper in PRICE_BUCKETS],
+        }
+        for key in self.attribute_facets:
+            facets[ATTRIBUTE_PREFIX + key] = self.attribute_counts(queryset, key)
+        return facets
+
+    def attribute_counts(self, queryset, key):
+        """[{'value': ..., 'count': ...}] of ``key``, most common first (GROUP BY on ProductAttribute)."""
+        products = self.filter(queryset, exclude=ATTRIBUTE_PREFIX + key).order_by().values('pk')
+        values = ProductAttribute.objects.filter(key=key, product__in=products).values('value') \
+            .annotate(count=Count('product_id', distinct=True)).order_by('-count', 'value')
+        return [{'value': v['value'], 'count': v['count']} for v in values]
+
+
+def order_by_attribute(queryset, ordering):
+    """
+    Apply ``ordering=attr.<key>`` / ``-attr.<key>``; products without a numeric
+    value for the key come last. Other orderings leave the queryset unchanged.
+    """
+    descending = ordering.startswith('-')
+    name = ordering.lstrip('-')
+    if not name.startswith(ATTRIBUTE_PREFIX) or len(name) == len(ATTRIBUTE_PREFIX):
+        return queryset
+    # LEFT JOIN on (key, product) instead of a correlated subquery per row
+    queryset = queryset.annotate(
+        sort_attribute=FilteredRelation('attributes', condition=Q(attributes__key=name[len(ATTRIBUTE_PREFIX):])),
+    ).annotate(attribute_sort=Min('sort_attribute__number'))
+    sort = F('attribute_sort').desc(nulls_last=True) if descending else F('attribute_sort').asc(nulls_last=True)
+    return queryset.order_by(sort, 'id')
@@ -0,0 +1,227 @@
+"""
+Per-request instrumentation.
+
+RequestMetricsMiddleware counts the SQL queries and database time of every
+request (all aliases), FastJSONRenderer reports its render time, and the
+middleware adds them to the response as a Server-Timing header:
+
+    Server-Timing: db;dur=4.1;desc="3 queries", render;dur=0.3, app;dur=6.2, total;dur=10.6
+
+``app`` is what is left: view code and serializers. Totals per view (URL
+name) are kept per process and exported in Prometheus text format by
+/stats/metrics/. ``QUERY_BUDGETS`` sets a maximum number of queries per view;
+going over it is logged, or raises QueryBudgetExceeded when
+``QUERY_BUDGET_RAISE`` is on (benchmarks, tests).
+
+Queries are counted per request context, not per connection: record_query is
+installed on every connection when it is opened (signals.py) and adds to the
+RequestMetrics of the current context. That way the queries of async views,
+which run the ORM in sync_to_async threads with their own connections, are
+counted too (those threads get a copy of the request's context).
+"""
+import contextvars
+import copy
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import dbstats
+
+logger = logging.getLogger(__name__)
+
+# seconds, buckets of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Django execute_wrapper, wraps every SQL statement
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install(connection):
+    # first, so that connection.execute_wrapper() blocks, which pop the last wrapper, leave it in place
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def timed_render():
+    metrics = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.render_time += time.perf_counter() - start
+
+
+class ViewStats:
+
+    def __init__(self):
+        self.requests = {}  # (method, status) -> request count
+        self.duration = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.response_bytes = 0
+        self.budget_exceeded = 0
+
+
+_lock = threading.Lock()
+_views = {}
+
+
+def record(view, method, status, duration, metrics, size, over_budget):
+    with _lock:
+        stats = _views.setdefault(view, ViewStats())
+        stats.requests[(method, status)] = stats.requests.get((method, status), 0) + 1
+        stats.duration += duration
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                stats.buckets[index] += 1
+        stats.queries += metrics.queries
+        stats.db_time += metrics.db_time
+        stats.render_time += metrics.render_time
+        stats.response_bytes += size
+        stats.budget_exceeded += over_budget
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+def query_budget(view):
+    return settings.QUERY_BUDGETS.get(view, settings.QUERY_BUDGET_DEFAULT)
+
+
+def server_timing(metrics, duration):
+    app = max(duration - metrics.db_time - metrics.render_time, 0)
+    return 'db;dur=%.1f;desc="%d queries", render;dur=%.1f, app;dur=%.1f, total;dur=%.1f' % (
+        metrics.db_time * 1000, metrics.queries, metrics.render_time * 1000, app * 1000, duration * 1000)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, duration):
+        view = view_name(request)
+        budget = query_budget(view)
+        over_budget = budget is not None and metrics.queries > budget
+        # StreamingHttpResponse (export) has not produced its content yet, no size
+        size = 0 if response.streaming else len(response.content)
+        record(view, request.method, response.status_code, duration, metrics, size, over_budget)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(metrics, duration)
+        if over_budget:
+            message = '%s %s ran %d queries, budget is %d' % (request.method, view, metrics.queries, budget)
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('"', '\\"')) for name, value in labels.items())
+
+
+def prometheus_metrics():
+    """Text exposition (Prometheus 0.0.4) of the per-view totals of this process."""
+    with _lock:
+        views = sorted((view, copy.deepcopy(stats)) for view, stats in _views.items())
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append('# HELP msistore_%s %s' % (name, help_text))
+        lines.append('# TYPE msistore_%s %s' % (name, kind))
+        lines.extend('msistore_%s%s %s' % (name, labels, value) for labels, value in samples)
+
+    metric('http_requests_total', 'counter', 'Requests by view, method and status.', [
+        (_labels(view=view, method=method, status=status), count)
+        for view, stats in views for (method, status), count in sorted(stats.requests.items())])
+
+    samples = []
+    for view, stats in views:
+        count = sum(stats.requests.values())
+        samples.extend(('_bucket' + _labels(view=view, le=bound), total)
+                       for bound, total in zip(DURATION_BUCKETS, stats.buckets))
+        samples.append(('_bucket' + _labels(view=view, le='+Inf'), count))
+        samples.append(('_sum' + _labels(view=view), '%.6f' % stats.duration))
+        samples.append(('_count' + _labels(view=view), count))
+    metric('http_request_duration_seconds', 'histogram', 'Request latency by view.', samples)
+
+    for name, attribute, help_text in [
+        ('db_queries_total', 'queries', 'SQL queries by view.'),
+        ('db_duration_seconds_total', 'db_time', 'Time spent in SQL by view.'),
+        ('render_duration_seconds_total', 'render_time', 'Time spent rendering JSON by view.'),
+        ('response_bytes_total', 'response_bytes', 'Response body bytes by view (streaming responses excluded).'),
+        ('query_budget_exceeded_total', 'budget_exceeded', 'Requests over their QUERY_BUDGETS entry by view.'),
+    ]:
+        metric(name, 'counter', help_text, [(_labels(view=view), round(getattr(stats, attribute), 6))
+                                            for view, stats in views])
+
+    metric('db_connections_created_total', 'counter', 'Database connections opened by alias.', [
+        (_labels(alias=alias), database['connections_created'])
+        for alias, database in dbstats.db_stats()['databases'].items()])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from msistore import attributes
+
+
+class Command(BaseCommand):
+    help = 'Rebuild ProductAttribute rows from Product.detail, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = attributes.backfill(batch_size=options['batch_size'],
+                                    log=lambda n: self.stdout.write('%d products processed' % n))
+        self.stdout.write(self.style.SUCCESS('Backfilled attributes of %d products' % count))
@@ -0,0 +1,123 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from msistore.benchmarks import SCENARIOS
+from msistore import synthetic
+
+
+def database_version():
+    if connection.vendor == 'mysql':
+        return connection.mysql_server_info
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version
+    return '.'.join(str(part) for part in connection.Database.version_info) \
+        if hasattr(connection.Database, 'version_info') else ''
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare ``p50_ms`` of every label present in both reports. Returns
+    (rows, regressions) where each row is (scenario, label, old, new, ratio).
+    """
+    rows = []
+    for name, labels in results.items():
+        for label, stats in labels.items():
+            old = baseline.get(name, {}).get(label)
+            if not isinstance(stats, dict) or not isinstance(old, dict) or 'p50_ms' not in stats \
+                    or not old.get('p50_ms'):
+                continue
+            rows.append((name, label, old['p50_ms'], stats['p50_ms'], stats['p50_ms'] / old['p50_ms']))
+    return rows, [row for row in rows if row[4] > threshold]
+
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks against a temporary test database and print a JSON report.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Scenarios to run (default: all). '
+                                                         'Available: %s' % ', '.join(sorted(SCENARIOS)))
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--images-per-product', type=int, default=3)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--likes', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the benchmark database between runs.')
+        parser.add_argument('--cache', action='store_true',
+                            help='Keep the response/count caches enabled (disabled by default so every '
+                                 'request reaches the database).')
+        parser.add_argument('--output', help='Also write the report to this file.')
+        parser.add_argument('--compare', help='Report from an earlier run; fail if a latency got worse than '
+                                              '--threshold times its baseline.')
+        parser.add_argument('--threshold', type=float, default=1.25)
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or sorted(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError('Unknown scenario(s): %s' % ', '.join(sorted(unknown)))
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        no_cache = override_settings(CATALOGUE_CACHE_TIMEOUT=0, PAGINATION_COUNT_CACHE_TIMEOUT=0)
+        if not options['cache']:
+            no_cache.enable()
+        # single process: the LocMem versions are the only ones there are
+        shared_cache = override_settings(CATALOGUE_CACHE_SHARED=True)
+        shared_cache.enable()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        started = timezone.now()
+        try:
+            results = {}
+            for name in names:
+                self.stderr.write('Running %s...' % name)
+                results[name] = SCENARIOS[name](options)
+            counts = synthetic.dataset_counts()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            shared_cache.disable()
+            if not options['cache']:
+                no_cache.disable()
+            teardown_test_environment()
+
+        # metadata to compare runs (same machine, same DB, same amount of data)
+        report = {
+            'meta': {
+                'started_at': started.isoformat(),
+                'finished_at': timezone.now().isoformat(),
+                'database': {'vendor': connection.vendor, 'version': database_version()},
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'platform': platform.platform(),
+                'options': {key: options[key] for key in (
+                    'products', 'images_per_product', 'users', 'orders', 'likes', 'seed', 'repeat', 'cache')},
+                'dataset': counts,
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+        if baseline is not None:
+            if baseline.get('meta', {}).get('database', {}).get('vendor') != connection.vendor:
+                self.stderr.write('Warning: baseline was run against a different database.')
+            rows, regressions = compare(results, baseline.get('results', {}), options['threshold'])
+            for name, label, old, new, ratio in rows:
+                self.stderr.write('%-12s %-50s %10.3f -> %10.3f ms  x%.2f' % (name, label[:50], old, new, ratio))
+            if regressions:
+                raise CommandError('%d benchmark(s) slower than x%.2f of the baseline' % (
+                    len(regressions), options['threshold']))
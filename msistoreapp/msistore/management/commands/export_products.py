@@ -0,0 +1,23 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from msistore import exports
+
+
+class Command(BaseCommand):
+    help = 'Export the product catalogue as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', choices=sorted(exports.CONTENT_TYPES), default='ndjson')
+        parser.add_argument('--file', help='Write to this file instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        stream = open(options['file'], 'w', encoding='utf-8', newline='') if options['file'] else sys.stdout
+        try:
+            for line in exports.export_lines(options['output'], chunk_size=options['chunk_size']):
+                stream.write(line)
+        finally:
+            if options['file']:
+                stream.close()
@@ -0,0 +1,30 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from msistore import uploads
+from msistore.models import Image, UploadStatus, User
+
+
+class Command(BaseCommand):
+    help = 'Upload images and avatars still pending (or failed) whose staged file is still on disk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--failed', action='store_true', help='Also retry uploads marked as failed.')
+        parser.add_argument('--clean', type=int, metavar='HOURS',
+                            help='Also delete staged files older than HOURS that no pending or failed row uses.')
+
+    def handle(self, *args, **options):
+        statuses = [UploadStatus.PENDING, UploadStatus.FAILED] if options['failed'] else [UploadStatus.PENDING]
+        jobs = [(uploads.process_image, Image.objects.filter(upload_status__in=statuses), 'file'),
+                (uploads.process_avatar, User.objects.filter(avatar_status__in=statuses), 'avatar')]
+        count = 0
+        for process, queryset, field in jobs:
+            for instance in queryset.iterator():
+                if os.path.exists(uploads.staged_path(getattr(instance, field).name)):
+                    process(instance.pk)
+                    count += 1
+        self.stdout.write(self.style.SUCCESS('Processed %d uploads' % count))
+        if options['clean'] is not None:
+            removed = uploads.remove_orphaned_files(options['clean'] * 3600)
+            self.stdout.write(self.style.SUCCESS('Deleted %d orphaned staged files' % removed))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from msistore import orders
+
+
+class Command(BaseCommand):
+    help = 'Recompute the OrderSummary row of every order.'
+
+    def handle(self, *args, **options):
+        count = orders.rebuild_order_summaries()
+        self.stdout.write(self.style.SUCCESS('Refreshed %d order summaries' % count))
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:54
+
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copy of msistore.search as of this migration, so later changes to the
+# tokenizer or the models cannot break it.
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 2
+DETAIL_WEIGHT = 1
+MAX_TERM_LENGTH = 50
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    text = str(text).lower().replace('\u0111', 'd')
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return [w[:MAX_TERM_LENGTH] for w in WORD_RE.findall(text)]
+
+
+def detail_values(detail):
+    if isinstance(detail, dict):
+        for key, value in detail.items():
+            yield key
+            yield from detail_values(value)
+    elif isinstance(detail, (list, tuple)):
+        for value in detail:
+            yield from detail_values(value)
+    elif detail is not None:
+        yield detail
+
+
+def build_search_index(apps, schema_editor):
+    Product = apps.get_model('msistore', 'Product')
+    ProductSearchToken = apps.get_model('msistore', 'ProductSearchToken')
+    batch = []
+    for product in Product.objects.only('id', 'name', 'description', 'detail').iterator(chunk_size=1000):
+        terms = Counter()
+        for term in tokenize(product.name):
+            terms[term] += NAME_WEIGHT
+        for term in tokenize(product.description):
+            terms[term] += DESCRIPTION_WEIGHT
+        for value in detail_values(product.detail):
+            for term in tokenize(value):
+                terms[term] += DETAIL_WEIGHT
+        batch.extend(ProductSearchToken(product_id=product.pk, term=term, weight=weight)
+                     for term, weight in terms.items())
+        if len(batch) >= 1000:
+            ProductSearchToken.objects.bulk_create(batch)
+            batch = []
+    ProductSearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msistore', '0014_alter_statusorder_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=50)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='msistore.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'product'], name='search_term_product_idx')],
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
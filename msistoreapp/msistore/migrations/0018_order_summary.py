@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:00
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def parse_quantity(quantity):
+    try:
+        return max(int(quantity), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def build_order_summaries(apps, schema_editor):
+    # frozen copy of msistore.orders.refresh_order_summary as of this migration
+    Order = apps.get_model('msistore', 'Order')
+    OrderItem = apps.get_model('msistore', 'OrderItem')
+    OrderSummary = apps.get_model('msistore', 'OrderSummary')
+    StatusOrder = apps.get_model('msistore', 'StatusOrder')
+    for order_id in Order.objects.values_list('id', flat=True).iterator():
+        item_count = 0
+        total_quantity = 0
+        total_price = Decimal('0')
+        items = OrderItem.objects.filter(order_id=order_id).values_list('quantity', 'price', 'product__new_price')
+        for quantity, price, current_price in items:
+            quantity = parse_quantity(quantity)
+            item_count += 1
+            total_quantity += quantity
+            total_price += (price if price is not None else current_price) * quantity
+        latest_status = StatusOrder.objects.filter(order_id=order_id).order_by('-id').first()
+        OrderSummary.objects.update_or_create(order_id=order_id, defaults={
+            'item_count': item_count,
+            'total_quantity': total_quantity,
+            'total_price': total_price,
+            'delivery_stage': latest_status.delivery_stage if latest_status else '',
+            'is_paid': latest_status.is_paid if latest_status else False,
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msistore', '0017_orderitem_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSummary',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='msistore.order')),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('total_quantity', models.PositiveIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('delivery_stage', models.CharField(blank=True, max_length=50)),
+                ('is_paid', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(build_order_summaries, migrations.RunPython.noop),
+    ]
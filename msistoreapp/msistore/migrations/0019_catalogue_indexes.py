@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:02
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    # keep the first like of each (user, product) pair before adding the unique constraint
+    Like = apps.get_model('msistore', 'Like')
+    duplicates = Like.objects.values('user', 'product').annotate(first_id=Min('id'), n=Count('id')).filter(n__gt=1)
+    for row in duplicates:
+        Like.objects.filter(user=row['user'], product=row['product']).exclude(id=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msistore', '0018_order_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'is_active', 'new_price'], name='product_cate_active_price_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_like_user_product'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:06
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copy of msistore.attributes as of this migration
+MAX_KEY_LENGTH = 50
+MAX_VALUE_LENGTH = 100
+MAX_NUMBER = Decimal('1e10')
+
+
+def to_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)[:MAX_VALUE_LENGTH]
+
+
+def to_number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    if not number.is_finite() or abs(number) >= MAX_NUMBER:
+        return None
+    return number.quantize(Decimal('0.0001'))
+
+
+def flatten(detail, prefix=''):
+    if isinstance(detail, dict):
+        for key, value in detail.items():
+            yield from flatten(value, '%s%s.' % (prefix, key))
+    elif isinstance(detail, (list, tuple)):
+        for value in detail:
+            yield from flatten(value, prefix)
+    elif detail is not None and prefix:
+        yield prefix[:-1][:MAX_KEY_LENGTH], detail
+
+
+def backfill_attributes(apps, schema_editor):
+    Product = apps.get_model('msistore', 'Product')
+    ProductAttribute = apps.get_model('msistore', 'ProductAttribute')
+    batch = []
+    for product in Product.objects.only('id', 'detail').iterator(chunk_size=500):
+        batch.extend(ProductAttribute(product_id=product.pk, key=key, value=to_value(value), number=to_number(value))
+                     for key, value in flatten(product.detail))
+        if len(batch) >= 1000:
+            ProductAttribute.objects.bulk_create(batch)
+            batch = []
+    ProductAttribute.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msistore', '0019_catalogue_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAttribute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50)),
+                ('value', models.CharField(max_length=100)),
+                ('number', models.DecimalField(decimal_places=4, max_digits=14, null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attributes', to='msistore.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'value', 'product'], name='attribute_key_value_idx'), models.Index(fields=['key', 'number', 'product'], name='attribute_key_number_idx'), models.Index(fields=['product', 'key', 'number'], name='attribute_product_key_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_attributes, migrations.RunPython.noop),
+    ]
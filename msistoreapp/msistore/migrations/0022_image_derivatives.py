@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msistore', '0021_upload_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='large_url',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='medium_url',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='thumb_url',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:11
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def build_preview_images(apps, schema_editor):
+    # frozen copy of msistore.previews as of this migration: latest done preview, else first done image
+    Product = apps.get_model('msistore', 'Product')
+    Image = apps.get_model('msistore', 'Image')
+    images = Image.objects.filter(product=OuterRef('pk'), upload_status='done')
+    Product.objects.update(preview_image=Coalesce(
+        Subquery(images.filter(preview=True).order_by('-id').values('pk')[:1]),
+        Subquery(images.order_by('id').values('pk')[:1]),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msistore', '0022_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='preview_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='msistore.image'),
+        ),
+        migrations.RunPython(build_preview_images, migrations.RunPython.noop),
+    ]
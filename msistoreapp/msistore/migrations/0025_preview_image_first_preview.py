@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:48
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def first_preview_images(apps, schema_editor):
+    # preview image = first done image flagged preview, else first done image (as ProductSerializer.get_images)
+    Product = apps.get_model('msistore', 'Product')
+    Image = apps.get_model('msistore', 'Image')
+    images = Image.objects.filter(product=OuterRef('pk'), upload_status='done')
+    Product.objects.update(preview_image=Coalesce(
+        Subquery(images.filter(preview=True).order_by('id').values('pk')[:1]),
+        Subquery(images.order_by('id').values('pk')[:1]),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msistore', '0024_product_cate_price_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(first_preview_images, migrations.RunPython.noop),
+    ]
@@ -4,6 +4,13 @@ from cloudinary.models import CloudinaryField
 import uuid
 
 
+class UploadStatus(models.TextChoices):
+    # state of the upload to the storage backend (see msistore/uploads.py)
+    PENDING = 'pending', 'Pending'
+    DONE = 'done', 'Done'
+    FAILED = 'failed', 'Failed'
+
+
 class BaseModel(models.Model):
     created_at = models.DateField(auto_now=True)
     updated_at = models.DateField(auto_now_add=True)
@@ -15,6 +22,7 @@ class BaseModel(models.Model):
 
 class User(AbstractUser):
     avatar = models.ImageField()
+    avatar_status = models.CharField(max_length=10, choices=UploadStatus.choices, default=UploadStatus.DONE)
     role = models.ForeignKey('Role', related_name="user", on_delete=models.CASCADE, default=1)
 
 
@@ -42,6 +50,17 @@ class Product(BaseModel):
     new_price = models.DecimalField(max_digits=6, decimal_places=2)
     category = models.ForeignKey('Category', related_name="product_cate", on_delete=models.CASCADE)
     brand = models.ForeignKey('Brand', related_name="product_brand", blank=True, null=True, on_delete=models.CASCADE)
+    # representative image for the product grid (?view=grid), updated by the Image signals, see msistore/previews.py
+    preview_image = models.ForeignKey('Image', related_name='+', blank=True, null=True, editable=False,
+                                      on_delete=models.SET_NULL)
+
+    class Meta:
+        indexes = [
+            # seek key of ProductCursorPagination (?cursor=&ordering=price)
+            models.Index(fields=['new_price', 'id'], name='product_price_id_idx'),
+            # category filter of ProductViewSet.list, sorted by id or by price (?ordering=price)
+            models.Index(fields=['category', 'new_price', 'id'], name='product_cate_price_id_idx'),
+        ]
 
     # related_name hỗ trợ truy vấn ngươc
     # Ví dụ đứng tu brand muốn tìm tất cả product đang active từ brand đó
@@ -53,6 +72,35 @@ class Product(BaseModel):
         return self.name
 
 
+class ProductSearchToken(models.Model):
+    # Inverted index for the product search, see msistore/search.py
+    product = models.ForeignKey(Product, related_name="search_tokens", on_delete=models.CASCADE)
+    term = models.CharField(max_length=50)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'product'], name='search_term_product_idx'),
+        ]
+
+
+class ProductAttribute(models.Model):
+    # Specifications flattened from Product.detail (1 row per key / value) to filter and sort with indexes,
+    # kept in sync when a Product is saved, see msistore/attributes.py
+    product = models.ForeignKey(Product, related_name="attributes", on_delete=models.CASCADE)
+    key = models.CharField(max_length=50)
+    value = models.CharField(max_length=100)
+    number = models.DecimalField(max_digits=14, decimal_places=4, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['key', 'value', 'product'], name='attribute_key_value_idx'),
+            models.Index(fields=['key', 'number', 'product'], name='attribute_key_number_idx'),
+            # joined from product when sorting by a specification (?ordering=attr.<key>)
+            models.Index(fields=['product', 'key', 'number'], name='attribute_product_key_idx'),
+        ]
+
+
 class Brand(models.Model):
     name = models.CharField(max_length=50)
 
@@ -71,6 +119,11 @@ class Image(models.Model):
     file = models.ImageField()
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     preview = models.BooleanField(blank=False, default=False)
+    upload_status = models.CharField(max_length=10, choices=UploadStatus.choices, default=UploadStatus.DONE)
+    # thumbnails made at upload time (msistore/derivatives.py), empty for older images -> use the original file
+    thumb_url = models.CharField(max_length=255, blank=True)
+    medium_url = models.CharField(max_length=255, blank=True)
+    large_url = models.CharField(max_length=255, blank=True)
 
     def __str__(self):
         return self.product
@@ -80,11 +133,23 @@ class Like(models.Model):
     user = models.ForeignKey(UserInfo, on_delete=models.CASCADE, related_name="like_user")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="like_product")
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_like_user_product'),
+        ]
+
+
 class Order(BaseModel):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     user = models.ForeignKey(UserInfo, on_delete=models.SET_NULL, null=True)
     products = models.ManyToManyField(Product, through='OrderItem')
 
+    class Meta:
+        indexes = [
+            # order history of a user (get_receipt, summaries)
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+        ]
+
     # def __str__(self):
     #     return self.uuid
 
@@ -93,6 +158,8 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product,related_name="order_item_prd", on_delete=models.CASCADE)
     order = models.ForeignKey(Order,related_name="order_item_order", on_delete=models.CASCADE)
     quantity = models.CharField(max_length=3)
+    # product price at the time of purchase (null for older orders)
+    price = models.DecimalField(max_digits=6, decimal_places=2, null=True)
 
 
 class StatusOrder(BaseModel):
@@ -101,3 +168,15 @@ class StatusOrder(BaseModel):
     delivery_method = models.CharField(max_length=50)
     delivery_stage = models.CharField(max_length=50)
     payment_method = models.CharField(max_length=50)
+
+
+class OrderSummary(models.Model):
+    # Summary table, 1 row per order (item count, total quantity, total price, latest status),
+    # kept up to date by msistore/orders.py when the order is created and when its items/statuses change
+    order = models.OneToOneField(Order, related_name="summary", on_delete=models.CASCADE, primary_key=True)
+    item_count = models.PositiveIntegerField(default=0)
+    total_quantity = models.PositiveIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    delivery_stage = models.CharField(max_length=50, blank=True)
+    is_paid = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,51 @@
+"""
+Maintenance of the OrderSummary projection.
+
+``refresh_order_summary`` recomputes the summary row of one order from its
+OrderItem and StatusOrder rows. It is called by the post_save / post_delete
+signals of both models; create_order bulk-inserts the items (no signal) but
+saves the StatusOrder last, so that signal builds the summary. The latest
+StatusOrder (highest id) is the order's current status.
+"""
+from decimal import Decimal
+
+from .models import Order, OrderItem, OrderSummary, StatusOrder
+
+
+def parse_quantity(quantity):
+    # OrderItem.quantity is a CharField, older rows may not hold a number
+    try:
+        return max(int(quantity), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def refresh_order_summary(order_id, summary_model=OrderSummary, item_model=OrderItem, status_model=StatusOrder):
+    item_count = 0
+    total_quantity = 0
+    total_price = Decimal('0')
+    items = item_model.objects.filter(order_id=order_id).values_list('quantity', 'price', 'product__new_price')
+    for quantity, price, current_price in items:
+        quantity = parse_quantity(quantity)
+        item_count += 1
+        total_quantity += quantity
+        # older orders have no purchase price, use the current product price
+        total_price += (price if price is not None else current_price) * quantity
+
+    latest_status = status_model.objects.filter(order_id=order_id).order_by('-id').first()
+    summary, _ = summary_model.objects.update_or_create(order_id=order_id, defaults={
+        'item_count': item_count,
+        'total_quantity': total_quantity,
+        'total_price': total_price,
+        'delivery_stage': latest_status.delivery_stage if latest_status else '',
+        'is_paid': latest_status.is_paid if latest_status else False,
+    })
+    return summary
+
+
+def rebuild_order_summaries(order_model=Order, **models):
+    count = 0
+    for order_id in order_model.objects.values_list('id', flat=True).iterator():
+        refresh_order_summary(order_id, **models)
+        count += 1
+    return count
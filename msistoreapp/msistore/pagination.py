@@ -1,40 +1,169 @@
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.response import Response
+import hashlib
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+
+from . import caching
+
+# catalogue namespace (see caching.py) whose version invalidates the cached counts: only products are counted
+COUNT_NAMESPACE = 'products'
+
+
+def count_cache_key(queryset):
+    # None = the query returns no rows (e.g. id__in=[])
+    try:
+        signature = str(queryset.query)
+    except EmptyResultSet:
+        return None
+    return 'pagination:count:%s:%s' % (caching.get_version(COUNT_NAMESPACE),
+                                       hashlib.md5(signature.encode('utf-8')).hexdigest())
+
+
+def count_cache_timeout():
+    # like the response cache, only with a shared cache: another worker's changes never bump a LocMem version
+    if not caching.shared_cache():
+        return 0
+    return getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 0)
+
+
+def cached_count(queryset):
+    """
+    COUNT(*) of ``queryset``, cached per query (filter signature) and products
+    version for ``settings.PAGINATION_COUNT_CACHE_TIMEOUT`` seconds; 0 disables
+    the cache. Saving or deleting a product or image bumps the version, so a
+    count never outlives the data: Paginator trims the last page to it.
+    """
+    timeout = count_cache_timeout()
+    if not timeout:
+        return queryset.count()
+    key = count_cache_key(queryset)
+    if key is None:
+        return 0
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+async def acached_count(queryset):
+    # async version of cached_count for msistore/async_views.py
+    timeout = await sync_to_async(count_cache_timeout)()
+    if not timeout:
+        return await queryset.acount()
+    key = await sync_to_async(count_cache_key)(queryset)
+    if key is None:
+        return 0
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, timeout)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, 'query'):
+            return cached_count(self.object_list)
+        return len(self.object_list)
+
 
 class CustomPagination(PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
     page_size_query_param = 'page_size'
+    limit_query_param = 'limit'
     max_page_size = 100
     default_page_size = 100
 
-    def get_page_size(self, request):
-        # Get the page size from the query parameter or use the default
-        page_size = request.query_params.get(self.page_size_query_param, self.default_page_size)
-
+    def _get_int_param(self, request, name):
         try:
-            # Try converting to an integer
-            return min(int(page_size), self.max_page_size)
-        except (TypeError, ValueError):
-            # Handle the case where page_size is None or not a valid integer
-            return self.default_page_size
+            value = int(request.query_params[name])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return value if value > 0 else None
+
+    def get_page_size(self, request):
+        """
+        Page size = ?page_size (or the default), capped by ?limit and max_page_size.
+        ``limit`` used to slice the page again after pagination; it is now folded
+        into the page size so the database gets a single LIMIT/OFFSET and
+        total_pages matches what the client actually receives.
+        """
+        page_size = self._get_int_param(request, self.page_size_query_param) or self.default_page_size
+        limit = self._get_int_param(request, self.limit_query_param)
+        if limit:
+            page_size = min(page_size, limit)
+        return min(page_size, self.max_page_size)
 
     def get_paginated_response(self, data):
         response = super().get_paginated_response(data)
         response.data['total_pages'] = self.page.paginator.num_pages
+        response.data['limit'] = self.page.paginator.per_page
         return response
 
-    def get_limit(self, request):
-        # Get the limit from the query parameter or use the default
-        limit = int(request.query_params.get('limit', self.max_page_size))
 
-        # Ensure the limit is within a reasonable range
-        return min(limit, self.max_page_size)
+class ReceiptPagination(CustomPagination):
+    # the order history differs per user, do not cache the count
+    django_paginator_class = Paginator
+    default_page_size = 20
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination for /products/?cursor=. The cursor holds the value of the
+    first ordering field (``id``, or ``new_price`` with ?ordering=price / -price)
+    and each page filters on it (e.g. ``new_price > x``) instead of using OFFSET
+    from the start. This is DRF's CursorPagination: it is not a two-column seek,
+    rows tied on that value are skipped with an offset stored in the cursor, so
+    a long run of equal prices is still walked with OFFSET (``id`` only breaks
+    the tie in ORDER BY). COUNT(*) only runs when the client asks with ?count=true.
+
+    Only ``price`` / ``-price`` are accepted as ?ordering in this mode; other
+    values (e.g. ``attr.<key>``, page-number mode only) are rejected with a 400.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('id',)
+    ordering_query_param = 'ordering'
+    orderings = {
+        'price': ('new_price', 'id'),
+        '-price': ('-new_price', '-id'),
+    }
+    count_query_param = 'count'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_query_param)
+        if ordering and ordering not in self.orderings:
+            raise ValidationError({self.ordering_query_param: 'with ?cursor, ordering must be one of: %s'
+                                                              % ', '.join(self.orderings)})
+        return self.orderings.get(ordering, self.ordering)
+
+    def decode_cursor(self, request):
+        # an empty ?cursor= is the first page
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
 
     def paginate_queryset(self, queryset, request, view=None):
-        """
-        Override paginate_queryset to apply both the limit and pagination to the queryset.
-        """
-        page_size = self.get_page_size(request)
-        limit = self.get_limit(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = cached_count(queryset)
+        return super().paginate_queryset(queryset, request, view=view)
 
-        result = super().paginate_queryset(queryset, request, view=view)
-        return result[:limit]  # Apply both pagination and limit
\ No newline at end of file
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+            response.data['total_pages'] = max(1, math.ceil(self.count / self.page_size))
+            response.data['limit'] = self.page_size
+        return response
@@ -1,6 +1,11 @@
-from rest_framework import permissions
+from rest_framework import permissions, throttling
 
 
 class UserInfoOwner(permissions.IsAuthenticated):
     def has_object_permission(self, request, view, userinfo):
         return request.user and request.user == userinfo.user
+
+
+class ExportRateThrottle(throttling.UserRateThrottle):
+    # REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']['export'], per user
+    scope = 'export'
@@ -0,0 +1,37 @@
+"""
+Maintenance of the denormalized Product.preview_image column.
+
+The preview image of a product is its first uploaded image flagged
+``preview``, or its first uploaded image when none is flagged: the same image
+ProductSerializer.get_images, the list fast path and the export put first.
+``refresh_preview_images`` recomputes it for a set of products with one UPDATE;
+it is called by the Image signals and by the bulk paths that skip signals
+(bulk_create / update).
+"""
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Image, Product, UploadStatus
+
+
+def preview_subquery(image_model=Image):
+    images = image_model.objects.filter(product=OuterRef('pk'), upload_status=UploadStatus.DONE)
+    return Coalesce(
+        Subquery(images.filter(preview=True).order_by('id').values('pk')[:1]),
+        Subquery(images.order_by('id').values('pk')[:1]),
+    )
+
+
+def refresh_preview_images(product_ids, product_model=Product, image_model=Image):
+    return product_model.objects.filter(pk__in=product_ids).update(preview_image=preview_subquery(image_model))
+
+
+def rebuild_preview_images(batch_size=1000, product_model=Product, image_model=Image):
+    count = 0
+    last_id = 0
+    while True:
+        ids = list(product_model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return count
+        count += refresh_preview_images(ids, product_model, image_model)
+        last_id = ids[-1]
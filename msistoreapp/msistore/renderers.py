@@ -0,0 +1,73 @@
+"""
+orjson based renderer / parser for DRF, configured in REST_FRAMEWORK.
+
+Output matches rest_framework.renderers.JSONRenderer: datetimes, Decimals and
+lazy strings still go through DRF's JSONEncoder, so only the encoding loop
+changes. Without orjson installed, or when the output cannot be produced by
+orjson (indented responses for the browsable API, UNICODE_JSON / COMPACT_JSON
+turned off), the stock DRF classes are used. Data orjson refuses (integers
+beyond 64 bits) is rendered by JSONRenderer as well. Floats are written in
+orjson's shortest form (``1e16`` rather than ``1e+16``, same value) and NaN /
+Infinity become null where JSONRenderer would raise; the models have no float
+fields.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from .instrumentation import timed_render
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # datetime/date/time encoded the DRF way (ms, 'Z' for UTC) instead of in orjson's format
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def use_orjson(self, accepted_media_type, renderer_context):
+        # orjson only writes compact UTF-8, without indentation
+        return (orjson is not None and self.compact and not self.ensure_ascii
+                and self.get_indent(accepted_media_type, renderer_context) is None)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # render time for Server-Timing / metrics (msistore/instrumentation.py)
+        with timed_render():
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type=None, renderer_context=None):
+        if not self.use_orjson(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # integers beyond 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # like JSONRenderer: escape U+2028 / U+2029 so the output can be embedded in <script>
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            body = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                body = body.decode(encoding)
+            return orjson.loads(body)
+        except (orjson.JSONDecodeError, UnicodeDecodeError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,116 @@
+"""
+Inverted index for product search.
+
+Each product is split into terms (name, description and the values of the
+``detail`` JSON) stored in ProductSearchToken, so a keyword search becomes an
+indexed lookup on ``term`` instead of a ``LIKE '%kw%'`` scan over Product.
+"""
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from .models import Product, ProductSearchToken
+
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 2
+DETAIL_WEIGHT = 1
+
+MAX_TERM_LENGTH = 50
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    # strip Vietnamese diacritics so that "chuột" and "chuot" find the same products
+    text = str(text).lower().replace('đ', 'd')
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return [w[:MAX_TERM_LENGTH] for w in _WORD_RE.findall(normalize(text))]
+
+
+def _detail_values(detail):
+    if isinstance(detail, dict):
+        for key, value in detail.items():
+            yield key
+            yield from _detail_values(value)
+    elif isinstance(detail, (list, tuple)):
+        for value in detail:
+            yield from _detail_values(value)
+    elif detail is not None:
+        yield detail
+
+
+def product_terms(product):
+    """Return a Counter of term -> weight for one product."""
+    terms = Counter()
+    for term in tokenize(product.name):
+        terms[term] += NAME_WEIGHT
+    for term in tokenize(product.description):
+        terms[term] += DESCRIPTION_WEIGHT
+    for value in _detail_values(product.detail):
+        for term in tokenize(value):
+            terms[term] += DETAIL_WEIGHT
+    return terms
+
+
+def build_tokens(product, token_model=ProductSearchToken):
+    return [token_model(product_id=product.pk, term=term, weight=weight)
+            for term, weight in product_terms(product).items()]
+
+
+def index_product(product):
+    with transaction.atomic():
+        ProductSearchToken.objects.filter(product_id=product.pk).delete()
+        ProductSearchToken.objects.bulk_create(build_tokens(product))
+
+
+def rebuild_index(batch_size=1000, product_model=Product, token_model=ProductSearchToken):
+    """Rebuild the whole index in batches. Returns the number of products indexed."""
+    token_model.objects.all().delete()
+    count = 0
+    batch = []
+    for product in product_model.objects.only('id', 'name', 'description', 'detail').iterator(chunk_size=batch_size):
+        batch.extend(build_tokens(product, token_model))
+        count += 1
+        if count % batch_size == 0:
+            token_model.objects.bulk_create(batch, batch_size=batch_size)
+            batch = []
+    token_model.objects.bulk_create(batch, batch_size=batch_size)
+    return count
+
+
+def match_q(kw):
+    """Q object matching products that contain any term of ``kw`` (no ranking)."""
+    terms = tokenize(kw)
+    if not terms:
+        return Q(pk__in=[])
+    return Q(pk__in=ProductSearchToken.objects.filter(_terms_q(terms, prefix='')).values('product_id'))
+
+
+def _terms_q(terms, prefix='search_tokens__'):
+    *exact, last = terms
+    # terms are stored lowercased, so istartswith is an exact prefix match; on MySQL it is a plain
+    # LIKE 'x%' that uses the (term, product) index under any collation (startswith is LIKE BINARY)
+    match = Q(**{prefix + 'term__istartswith': last})
+    if exact:
+        match |= Q(**{prefix + 'term__in': exact})
+    return match
+
+
+def search(queryset, kw):
+    """
+    Filter ``queryset`` to products matching any term of ``kw`` and order them by
+    relevance (sum of matched term weights). The last term is matched as a prefix
+    so partially typed keywords still find results.
+    """
+    terms = tokenize(kw)
+    if not terms:
+        return queryset.none()
+    return (queryset.filter(_terms_q(terms))
+            .annotate(search_score=Sum('search_tokens__weight'))
+            .order_by('-search_score', 'id'))
@@ -1,12 +1,20 @@
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import User, Product, Category, Brand, Image, Like, UserInfo, Order, OrderItem, StatusOrder
-from cloudinary.uploader import upload
+from .models import (
+    User, Product, Category, Brand, Image, Like, UserInfo, Order, OrderItem, StatusOrder, OrderSummary, UploadStatus
+)
+from .uploads import staged_files, enqueue, process_avatar, process_image
+from .caching import bump_version
+from .derivatives import SIZES as IMAGE_SIZES
+from .previews import refresh_preview_images
 
 
 class UserSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField(source='avatar')
     def get_image(self, user):
-        if user.avatar:
+        # while the upload is pending / failed avatar is a staging file name, not a URL (see avatar_status)
+        if user.avatar and user.avatar_status == UploadStatus.DONE:
             request = self.context.get('request')
             return request.build_absolute_uri(user.avatar) if request else ''
 
@@ -24,19 +32,21 @@ class UserSerializer(serializers.ModelSerializer):
         u = User(**data)
         u.set_password(u.password)
 
-        image_file = data['avatar']
-        result = upload(image_file)
-        u.avatar = result['url']
-
-        u.save()
+        # stage the avatar file, it is uploaded to the storage in the background after the commit
+        with staged_files([data['avatar']]) as (name,):
+            u.avatar = name
+            u.avatar_status = UploadStatus.PENDING
+            u.save()
+        enqueue(process_avatar, u.pk)
         return u
 
     class Meta:
         model = User
-        fields = ['id', 'first_name', 'last_name', 'username', 'password', 'image', 'avatar', 'email',]
+        fields = ['id', 'first_name', 'last_name', 'username', 'password', 'image', 'avatar', 'email', 'avatar_status']
         extra_kwargs = {
             'password': {'write_only': True},
             'avatar': {'write_only': True},
+            'avatar_status': {'read_only': True},
         }
 
 
@@ -56,47 +66,158 @@ class ImageSerializer(serializers.ModelSerializer):
     url = serializers.SerializerMethodField(source='file')
 
     def get_url(self, image):
-        if image.file:
+        # None until the background upload is done, see upload_status
+        if image.file and image.upload_status == UploadStatus.DONE:
             request = self.context.get('request')
             return request.build_absolute_uri(image.file) if request else ''
 
     class Meta:
         model = Image
-        fields = ['id', 'file', 'product', 'url', 'preview']
+        fields = ['id', 'file', 'product', 'url', 'preview', 'upload_status', 'thumb_url', 'medium_url', 'large_url']
         extra_kwargs = {
             'file': {'write_only': True},
+            'upload_status': {'read_only': True},
+            'thumb_url': {'read_only': True},
+            'medium_url': {'read_only': True},
+            'large_url': {'read_only': True},
         }
 
     def create(self, validated_data):
         data = validated_data.copy()
         image = Image(**data)
 
-        image_file = data['file']
-        result = upload(image_file)
-        image.file = result['url']
-
-        image.save()
+        # stage the file, it is uploaded to the storage in the background after the commit
+        with staged_files([data['file']]) as (name,):
+            image.file = name
+            image.upload_status = UploadStatus.PENDING
+            image.save()
+        enqueue(process_image, image.pk)
         return image
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class BulkImageSerializer(serializers.Serializer):
+    """
+    Many images for one or more products in one request: ``files`` with either one
+    ``product`` for all of them or one ``products`` entry per file. ``preview`` lists
+    the indexes of the files to use as preview (at most one per product); they
+    replace the current preview of their product.
+    """
+    files = serializers.ListField(child=serializers.ImageField(), allow_empty=False)
+    product = serializers.IntegerField(required=False)
+    products = serializers.ListField(child=serializers.IntegerField(), required=False)
+    preview = serializers.ListField(child=serializers.IntegerField(min_value=0), required=False)
+
+    def validate(self, attrs):
+        files = attrs['files']
+        if 'products' in attrs:
+            product_ids = attrs['products']
+            if len(product_ids) != len(files):
+                raise serializers.ValidationError({'products': 'Expected one product per file.'})
+        elif 'product' in attrs:
+            product_ids = [attrs['product']] * len(files)
+        else:
+            raise serializers.ValidationError({'product': 'Either product or products is required.'})
+
+        products = Product.objects.in_bulk(set(product_ids))
+        missing = sorted(set(product_ids) - set(products))
+        if missing:
+            raise serializers.ValidationError({'products': 'Invalid product ids: %s' % missing})
+
+        previews = set(attrs.get('preview', []))
+        if any(index >= len(files) for index in previews):
+            raise serializers.ValidationError({'preview': 'Index out of range.'})
+        preview_products = [product_ids[index] for index in previews]
+        if len(preview_products) != len(set(preview_products)):
+            raise serializers.ValidationError({'preview': 'Only one preview image per product.'})
+
+        attrs['product_ids'] = product_ids
+        attrs['previews'] = previews
+        return attrs
+
+    def create(self, validated_data):
+        files = validated_data['files']
+        product_ids = validated_data['product_ids']
+        previews = validated_data['previews']
+
+        # stage all files, 1 INSERT for all images, uploaded in parallel by the pool of uploads.py
+        with staged_files(files) as names, transaction.atomic():
+            preview_products = {product_ids[index] for index in previews}
+            if preview_products:
+                Image.objects.filter(product_id__in=preview_products, preview=True).update(preview=False)
+            images = Image.objects.bulk_create([
+                Image(product_id=product_id, file=name, preview=index in previews, upload_status=UploadStatus.PENDING)
+                for index, (product_id, name) in enumerate(zip(product_ids, names))
+            ])
+            if not all(image.pk for image in images):
+                # MySQL returns no pks from bulk_create, fetch them back by staged file name (unique)
+                by_name = {image.file.name: image for image in Image.objects.filter(file__in=names)}
+                images = [by_name[name] for name in names]
+            # bulk_create / update send no signals
+            if preview_products:
+                refresh_preview_images(preview_products)
+            transaction.on_commit(lambda: bump_version('products'))
+            for image in images:
+                enqueue(process_image, image.pk)
+        return images
+
+
+def image_size(request, default=None):
+    # ?image_size=thumb|medium|large
+    size = request.query_params.get('image_size', default) if hasattr(request, 'query_params') else default
+    return size if size in IMAGE_SIZES else None
+
+
+def image_url(image, request, size=None):
+    # the thumbnail when there is one, else the original image
+    file = (getattr(image, '%s_url' % size) if size else '') or image.file.name
+    return absolute_image_url(file, image.preview, request)
+
+
+def absolute_image_url(file, preview, request):
+    if preview:
+        return file
+    return request.build_absolute_uri(file)
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets: ``fields`` (e.g. parsed from ``?fields=id,name``) limits
+    the output to those names. Dropped fields are removed before serialization,
+    so SerializerMethodFields like ``images`` are never evaluated. Unknown names
+    are ignored; when none of the names is a field, every field is output.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields and not set(fields).isdisjoint(self.fields):
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     # Cach de lay brand(id, name) gắn vao view luôn thay vì chỉ lấy id
     # brand = BrandSerializer()
 
     images = serializers.SerializerMethodField()
 
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        # Load the images of all products in 1 query instead of 1 query per product (N+1)
+        # prefix is for products reached through a relation, e.g. 'product__' for OrderItem
+        # images still uploading (pending/failed) have no URL yet, leave them out
+        return queryset.prefetch_related(
+            Prefetch(prefix + 'image_set', queryset=Image.objects.filter(upload_status=UploadStatus.DONE).order_by('id'))
+        )
+
     def get_images(self, obj):
         # obj = product
+        # image_set.all() uses the prefetch_related cache when the view called setup_eager_loading
         request = self.context.get('request')
-        i = Image.objects.filter(product=obj).values()
-        urls = []
-        for data in i:
-            if data['preview']:
-                urls.insert(0, data['file'])
-            else:
-                urls.append(request.build_absolute_uri(data['file']))
-        if request:
-            return urls
+        if not request:
+            return None
+        size = image_size(request)
+        return [image_url(image, request, size) for image in sorted(obj.image_set.all(), key=lambda i: not i.preview)]
 
     class Meta:
         model = Product
@@ -104,6 +225,33 @@ class ProductSerializer(serializers.ModelSerializer):
                   'is_active']
 
 
+class ProductListSerializer(ProductSerializer):
+    # Product list: no description / detail (specs JSON), the detail comes from /products/<id>/
+
+    class Meta(ProductSerializer.Meta):
+        fields = ['id', 'name', 'old_price', 'new_price', 'category', 'brand', 'images', 'is_active']
+
+
+class ProductGridSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    # Product grid (?view=grid): a single representative image (Product.preview_image), no detail / image list
+
+    image = serializers.SerializerMethodField()
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('preview_image')
+
+    def get_image(self, obj):
+        request = self.context.get('request')
+        if not request or obj.preview_image is None:
+            return None
+        return image_url(obj.preview_image, request, image_size(request, default='thumb'))
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'old_price', 'new_price', 'category', 'brand', 'image', 'is_active']
+
+
 class LikeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Like
@@ -118,6 +266,12 @@ class UserInfoSerializer(serializers.ModelSerializer):
 
 class OrderItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer()
+
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        queryset = queryset.select_related(prefix + 'product')
+        return ProductSerializer.setup_eager_loading(queryset, prefix=prefix + 'product__')
+
     class Meta:
         model = OrderItem
         fields = '__all__'
@@ -134,3 +288,27 @@ class StatusOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = StatusOrder
         fields = '__all__'
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    uuid = serializers.UUIDField(source='order.uuid', read_only=True)
+    created_at = serializers.DateField(source='order.created_at', read_only=True)
+
+    class Meta:
+        model = OrderSummary
+        fields = ['order', 'uuid', 'created_at', 'item_count', 'total_quantity', 'total_price', 'delivery_stage',
+                  'is_paid']
+
+
+class ReceiptSerializer(serializers.Serializer):
+    # {'order': ..., 'order_items': [...], 'status': ...} for one order,
+    # used with OrderViewSet.get_receipt_queryset so that it runs no queries per order
+    order = OrderSerializer(source='*')
+    order_items = OrderItemSerializer(source='order_item_order', many=True)
+    status = serializers.SerializerMethodField()
+    summary = OrderSummarySerializer(read_only=True)
+
+    def get_status(self, order):
+        # latest status first (get_receipt_queryset), the same one OrderSummary shows
+        statuses = order.status_order.all()
+        return StatusOrderSerializer(statuses[0]).data if statuses else None
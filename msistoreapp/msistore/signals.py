@@ -0,0 +1,91 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Product, Image, Category, Brand, Order, OrderItem, StatusOrder
+from . import attributes, caching, dbstats, instrumentation, orders, previews, search
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_product(instance)
+
+
+@receiver(post_save, sender=Product)
+def sync_product_attributes(sender, instance, raw=False, **kwargs):
+    if not raw:
+        attributes.sync_product(instance)
+
+
+def _deleting_product(origin):
+    return isinstance(origin, Product) or (isinstance(origin, QuerySet) and origin.model is Product)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def refresh_preview_image(sender, instance, raw=False, origin=None, **kwargs):
+    # images deleted with their product (cascade) need no update
+    if raw or _deleting_product(origin):
+        return
+    previews.refresh_preview_images([instance.product_id])
+
+
+# Model -> namespaces of the response cache affected when it changes
+# (/products/?facets=true shows category and brand names)
+CACHE_DEPENDENCIES = {
+    Product: ('products',),
+    Image: ('products',),
+    Category: ('categories', 'products'),
+    Brand: ('brands', 'products'),
+}
+
+
+def invalidate_catalogue_cache(sender, **kwargs):
+    # bump after the commit, so other requests cannot cache the old data again
+    namespaces = CACHE_DEPENDENCIES[sender]
+
+    def bump():
+        for namespace in namespaces:
+            caching.bump_version(namespace)
+    transaction.on_commit(bump)
+
+
+for model in CACHE_DEPENDENCIES:
+    post_save.connect(invalidate_catalogue_cache, sender=model)
+    post_delete.connect(invalidate_catalogue_cache, sender=model)
+
+
+def _deleting_order(origin):
+    return isinstance(origin, Order) or (isinstance(origin, QuerySet) and origin.model is Order)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_save, sender=StatusOrder)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_delete, sender=StatusOrder)
+def refresh_order_summary(sender, instance, raw=False, origin=None, **kwargs):
+    # deleting the order deletes its summary (cascade), nothing to recompute
+    if raw or _deleting_order(origin):
+        return
+    orders.refresh_order_summary(instance.order_id)
+
+
+@receiver(request_started)
+def count_request(sender, **kwargs):
+    dbstats.record_request()
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    # new connections per alias; compared with the request count it shows whether CONN_MAX_AGE / the pool help
+    dbstats.record_connection(connection.alias)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # query counts per request, see instrumentation.RequestMetricsMiddleware
+    instrumentation.install(connection)
@@ -0,0 +1,51 @@
+"""
+Storage backends for uploaded images. The backend is chosen with
+``settings.IMAGE_STORAGE_BACKEND``; every backend has ``upload(path) -> url``
+and ``delete(url)``.
+"""
+import os
+import shutil
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class CloudinaryStorage:
+
+    def upload(self, path, **options):
+        from cloudinary.uploader import upload
+
+        return upload(path, **options)['url']
+
+    def delete(self, url):
+        from cloudinary.uploader import destroy
+
+        # .../image/upload/v1700000000/<public_id>.<ext>
+        public_id = url.split('/upload/', 1)[-1]
+        parts = public_id.split('/', 1)
+        if len(parts) == 2 and parts[0].startswith('v') and parts[0][1:].isdigit():
+            public_id = parts[1]
+        destroy(os.path.splitext(public_id)[0])
+
+
+class LocalStorage:
+    # Stores files under MEDIA_ROOT, for dev/test instead of Cloudinary
+
+    def __init__(self, root=None, base_url=None):
+        self.root = str(root or settings.MEDIA_ROOT)
+        self.base_url = base_url or settings.MEDIA_URL
+
+    def upload(self, path, **options):
+        name = os.path.basename(path)
+        os.makedirs(self.root, exist_ok=True)
+        shutil.copyfile(path, os.path.join(self.root, name))
+        return '%s%s' % (self.base_url, name)
+
+    def delete(self, url):
+        path = os.path.join(self.root, os.path.basename(url))
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def get_storage():
+    return import_string(settings.IMAGE_STORAGE_BACKEND)()
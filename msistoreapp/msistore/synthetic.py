@@ -0,0 +1,192 @@
+"""
+Synthetic data for benchmarks. Rows are inserted with bulk_create, so signal
+driven side tables (search index, attributes...) are rebuilt explicitly at the end.
+"""
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+
+from .models import Brand, Category, Image, Like, Order, OrderItem, Product, Role, StatusOrder, User, UserInfo
+from . import attributes, orders as order_service, previews, search
+
+BRANDS = ['MSI', 'Asus', 'Acer', 'Dell', 'Lenovo', 'HP', 'Gigabyte', 'Razer']
+CATEGORIES = ['Laptop', 'Monitor', 'Mainboard', 'Graphics card', 'Mouse', 'Keyboard', 'Headset', 'Chair']
+WORDS = ['gaming', 'creator', 'stealth', 'titan', 'katana', 'modern', 'prestige', 'pro', 'ultra', 'slim',
+         'rgb', 'wireless', 'mechanical', 'curved', 'oled', 'thunderbolt', 'white', 'black', 'edition', 'max']
+CPUS = ['i5-13420H', 'i7-13620H', 'i9-13980HX', 'Ryzen 5 7535HS', 'Ryzen 7 7840HS', 'Ryzen 9 7945HX']
+GPUS = ['RTX 4050', 'RTX 4060', 'RTX 4070', 'RTX 4080', 'RTX 4090', 'Iris Xe']
+RAMS = [8, 16, 32, 64]
+
+
+def random_detail(rng):
+    return {
+        'cpu': rng.choice(CPUS),
+        'gpu': rng.choice(GPUS),
+        'ram': rng.choice(RAMS),
+        'storage': '%d GB SSD' % rng.choice([512, 1024, 2048]),
+        'weight': round(rng.uniform(1.2, 3.5), 2),
+    }
+
+
+def generate_catalogue(products=1000, images_per_product=3, batch_size=1000, seed=0):
+    """Create ``products`` random products (plus brands, categories and images)."""
+    rng = random.Random(seed)
+    brands = [Brand.objects.get_or_create(name=name)[0] for name in BRANDS]
+    categories = [Category.objects.get_or_create(name=name)[0] for name in CATEGORIES]
+
+    for offset in range(0, products, batch_size):
+        last_id = Product.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        batch = []
+        for i in range(min(batch_size, products - offset)):
+            brand = rng.choice(brands)
+            old_price = Decimal(rng.randrange(10000, 999999)) / 100
+            batch.append(Product(
+                name='%s %s %s %d' % (brand.name, rng.choice(WORDS), rng.choice(WORDS), last_id + i + 1),
+                description=' '.join(rng.choice(WORDS) for _ in range(12)),
+                detail=random_detail(rng),
+                old_price=old_price,
+                new_price=(old_price * Decimal('0.9')).quantize(Decimal('0.01')),
+                category=rng.choice(categories),
+                brand=brand,
+            ))
+        created = Product.objects.bulk_create(batch)
+        if not all(p.pk for p in created):
+            # the backend returns no pks from bulk_create (MySQL), fetch them back in id order
+            created = list(Product.objects.filter(id__gt=last_id).order_by('id'))
+        Image.objects.bulk_create([
+            Image(product=product, file='https://res.cloudinary.com/demo/image/upload/p%d_%d.jpg' % (product.pk, n),
+                  preview=(n == 0))
+            for product in created for n in range(images_per_product)
+        ], batch_size=batch_size)
+
+    search.rebuild_index(batch_size=batch_size)
+    attributes.backfill(batch_size=batch_size)
+    previews.rebuild_preview_images(batch_size=batch_size)
+
+
+def ensure_catalogue(products, **kwargs):
+    missing = products - Product.objects.count()
+    if missing > 0:
+        generate_catalogue(missing, **kwargs)
+
+
+def ensure_role():
+    # User.role defaults to Role pk=1
+    if not Role.objects.filter(pk=1).exists():
+        Role.objects.create(pk=1, name='customer')
+
+
+def ensure_customer(username='bench'):
+    """Return a user with a UserInfo row (orders reference UserInfo)."""
+    ensure_role()
+    user, created = User.objects.get_or_create(username=username, defaults={'avatar': 'avatar.jpg'})
+    if created:
+        UserInfo.objects.create(user=user, country='VN', city='HCM', street='Nguyen Hue',
+                                home_number='1', phone_number='0900000000')
+    return user
+
+
+STAGES = ['pending', 'confirmed', 'shipping', 'delivered']
+
+
+def generate_orders(user, orders=1000, lines_per_order=3, batch_size=500, seed=0):
+    """Create ``orders`` orders for ``user`` with random items and one StatusOrder each."""
+    rng = random.Random(seed)
+    products = list(Product.objects.values_list('id', 'new_price'))
+    for offset in range(0, orders, batch_size):
+        last_id = Order.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        created = Order.objects.bulk_create([Order(user_id=user.pk) for _ in range(min(batch_size, orders - offset))])
+        if not all(o.pk for o in created):
+            created = list(Order.objects.filter(id__gt=last_id).order_by('id'))
+        items = []
+        for order in created:
+            for product_id, price in rng.sample(products, min(lines_per_order, len(products))):
+                items.append(OrderItem(order=order, product_id=product_id, quantity=str(rng.randint(1, 3)),
+                                       price=price))
+        OrderItem.objects.bulk_create(items, batch_size=batch_size)
+        StatusOrder.objects.bulk_create([
+            StatusOrder(order=order, is_paid=rng.random() < 0.5, delivery_method='ship',
+                        delivery_stage=rng.choice(STAGES), payment_method='paypal')
+            for order in created
+        ], batch_size=batch_size)
+        for order in created:
+            order_service.refresh_order_summary(order.pk)
+
+
+CITIES = ['HCM', 'Ha Noi', 'Da Nang', 'Can Tho', 'Hai Phong', 'Hue']
+
+
+def generate_users(users=100, batch_size=1000, seed=0):
+    """Create ``users`` customers (User + UserInfo), all with the password ``bench``."""
+    rng = random.Random(seed)
+    ensure_role()
+    # hash once, hashing per user would take most of the generation time
+    password = make_password('bench')
+    for offset in range(0, users, batch_size):
+        last_id = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        created = User.objects.bulk_create([
+            User(username='customer-%d' % (last_id + i + 1), password=password, avatar='avatar.jpg',
+                 first_name=rng.choice(WORDS).title(), last_name=rng.choice(WORDS).title(),
+                 email='customer-%d@example.com' % (last_id + i + 1))
+            for i in range(min(batch_size, users - offset))
+        ])
+        if not all(u.pk for u in created):
+            created = list(User.objects.filter(id__gt=last_id).order_by('id'))
+        UserInfo.objects.bulk_create([
+            UserInfo(user=user, country='VN', city=rng.choice(CITIES), street=rng.choice(WORDS).title(),
+                     home_number=str(rng.randint(1, 500)), phone_number='09%08d' % rng.randrange(10 ** 8))
+            for user in created
+        ], batch_size=batch_size)
+
+
+def generate_likes(likes=1000, batch_size=1000, seed=0):
+    """Create up to ``likes`` new likes between random customers and products."""
+    rng = random.Random(seed)
+    user_ids = list(UserInfo.objects.values_list('user_id', flat=True))
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    existing = set(Like.objects.values_list('user_id', 'product_id'))
+    # (user, product) is unique, do not create more than the pairs left
+    likes = min(likes, len(user_ids) * len(product_ids) - len(existing))
+    pairs = set()
+    while len(pairs) < likes:
+        pair = (rng.choice(user_ids), rng.choice(product_ids))
+        if pair not in existing:
+            pairs.add(pair)
+    Like.objects.bulk_create([Like(user_id=user_id, product_id=product_id) for user_id, product_id in pairs],
+                             batch_size=batch_size)
+
+
+def ensure_dataset(products=1000, images_per_product=3, users=100, orders=1000, likes=1000, seed=0):
+    """
+    Top the database up to the given row counts (existing rows are kept, so
+    runs with the same counts and seed are comparable). Orders are spread
+    evenly over the generated customers. Returns the resulting counts.
+    """
+    ensure_catalogue(products, images_per_product=images_per_product, seed=seed)
+    missing = users - UserInfo.objects.filter(user__username__startswith='customer-').count()
+    if missing > 0:
+        generate_users(missing, seed=seed)
+    customers = list(User.objects.filter(username__startswith='customer-', userinfo__isnull=False)
+                     .order_by('id')[:users])
+    missing = orders - Order.objects.count()
+    if missing > 0 and customers:
+        for index, user in enumerate(customers):
+            count = missing // len(customers) + (index < missing % len(customers))
+            if count:
+                generate_orders(user, count, seed=seed + index)
+    missing = likes - Like.objects.count()
+    if missing > 0:
+        generate_likes(missing, seed=seed)
+    return dataset_counts()
+
+
+def dataset_counts():
+    return {
+        'products': Product.objects.count(),
+        'images': Image.objects.count(),
+        'users': User.objects.count(),
+        'orders': Order.objects.count(),
+        'order_items': OrderItem.objects.count(),
+        'likes': Like.objects.count(),
+    }
@@ -1,3 +1,1091 @@
-from django.test import TestCase
+import csv
+import datetime
+import decimal
+import io
+import json
+import os
+import tempfile
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .models import Brand, Category, Image, Order, Product, UploadStatus
+from .serializers import ProductListSerializer, ProductSerializer
+from . import (
+    benchmarks, caching, db_routers, exports, instrumentation, perms, renderers, search, storage, synthetic, uploads
+)
+
+ORDER_STATUS = json.dumps({'delivery_method': 'ship', 'delivery_stage': 'pending', 'payment_method': 'cash'})
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=0, PAGINATION_COUNT_CACHE_TIMEOUT=0)
+class QueryCountTestCase(TestCase):
+    """
+    Base class for query-count regression tests. Response and COUNT caches are
+    off so every request reaches the database.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def request(self, method, url, data=None):
+        response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 300, response.content)
+        return response
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            self.request(method, url, data)
+        return len(queries)
+
+    def assertConstantQueries(self, method, url, grow, data=None):
+        """Run the request, call ``grow()`` to add rows, and check the request still runs as many queries."""
+        expected = self.count_queries(method, url, data)
+        grow()
+        with self.assertNumQueries(expected):
+            self.request(method, url, data)
+        return expected
+
+
+class ProductQueryCountTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        synthetic.generate_catalogue(5, images_per_product=2)
+
+    def test_list(self):
+        expected = self.assertConstantQueries('get', '/products/', lambda: synthetic.generate_catalogue(
+            50, images_per_product=3, seed=1))
+        # COUNT, page, images of the page
+        self.assertEqual(expected, 3)
+
+    def test_retrieve(self):
+        product = Product.objects.order_by('id').first()
+        expected = self.assertConstantQueries('get', '/products/%d/' % product.pk, lambda: product.image_set.create(
+            file='https://res.cloudinary.com/demo/image/upload/extra.jpg'))
+        # product, images
+        self.assertEqual(expected, 2)
+
+
+class SparseFieldsTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        synthetic.generate_catalogue(3, images_per_product=2)
+        self.product = Product.objects.order_by('id').first()
+
+    def get(self, url, fields=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request('get', url, {'fields': fields} if fields else None)
+        return response.json(), [query['sql'] for query in queries.captured_queries]
+
+    def test_list_and_detail_serializers(self):
+        rows, _ = self.get('/products/')
+        self.assertEqual(list(rows['results'][0]), ProductListSerializer.Meta.fields)
+        product, _ = self.get('/products/%d/' % self.product.pk)
+        self.assertEqual(list(product), ProductSerializer.Meta.fields)
+        self.assertIn('description', product)
+        self.assertIn('detail', product)
+
+    def test_fields_skip_images_and_heavy_columns(self):
+        for url in ('/products/', '/products/%d/' % self.product.pk):
+            data, queries = self.get(url, 'id,name')
+            row = data['results'][0] if 'results' in data else data
+            self.assertEqual(list(row), ['id', 'name'])
+            self.assertFalse([sql for sql in queries if 'msistore_image' in sql], url)
+            for sql in queries:
+                self.assertNotIn('"description"', sql, url)
+                self.assertNotIn('"detail"', sql, url)
+
+            _, queries = self.get(url, 'id,images')
+            self.assertTrue([sql for sql in queries if 'msistore_image' in sql], url)
+
+    def test_unknown_fields(self):
+        for fast_path in (False, True):
+            with self.settings(PRODUCT_LIST_FAST_PATH=fast_path):
+                rows, _ = self.get('/products/', 'nope')
+                self.assertEqual(list(rows['results'][0]), ProductListSerializer.Meta.fields)
+                rows, _ = self.get('/products/', 'id,nope')
+                self.assertEqual(list(rows['results'][0]), ['id'])
+        product, queries = self.get('/products/%d/' % self.product.pk, 'nope')
+        self.assertEqual(list(product), ProductSerializer.Meta.fields)
+        # every field, including the images, still loaded in one query
+        self.assertEqual(len(queries), 2)
+
+
+class OrderQueryCountTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        synthetic.generate_catalogue(20)
+        self.user = synthetic.ensure_customer()
+        self.client.force_authenticate(self.user)
+
+    def test_receipts(self):
+        synthetic.generate_orders(self.user, 1)
+        self.assertConstantQueries('get', '/order/get-receipt/',
+                                   lambda: synthetic.generate_orders(self.user, 30, lines_per_order=5, seed=1))
+        self.assertEqual(Order.objects.filter(user_id=self.user.pk).count(), 31)
+
+    def test_receipts_page(self):
+        synthetic.generate_orders(self.user, 1)
+        self.assertConstantQueries('get', '/order/get-receipt/', lambda: synthetic.generate_orders(self.user, 30),
+                                   data={'page': 1, 'page_size': 20})
+
+    def test_receipt_by_uuid(self):
+        synthetic.generate_orders(self.user, 1, lines_per_order=1)
+        order = Order.objects.get(user_id=self.user.pk)
+        data = {'uuid': json.dumps(str(order.uuid))}
+
+        def grow():
+            items = list(Product.objects.order_by('id').values_list('id', 'new_price')[1:10])
+            for product_id, price in items:
+                order.order_item_order.create(product_id=product_id, quantity='1', price=price)
+
+        self.assertConstantQueries('post', '/order/get-receipt/', grow, data=data)
+
+    def test_create_order(self):
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+
+        def order(lines):
+            return {'order_items': json.dumps([{'id': product_id, 'quantity': 1} for product_id in product_ids[:lines]]),
+                    'order_status': ORDER_STATUS}
+
+        expected = self.count_queries('post', '/order/create/', order(1))
+        with self.assertNumQueries(expected):
+            self.request('post', '/order/create/', order(20))
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=0, PAGINATION_COUNT_CACHE_TIMEOUT=0)
+class ProductOrderingTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        synthetic.generate_catalogue(30)
+
+    def prices(self, params):
+        response = self.client.get('/products/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [float(product['new_price']) for product in response.json()['results']]
+
+    def test_price_ordering_in_both_pagination_modes(self):
+        for params in ({'ordering': 'price'}, {'ordering': 'price', 'cursor': ''}):
+            prices = self.prices(params)
+            self.assertEqual(prices, sorted(prices))
+        prices = self.prices({'ordering': '-price'})
+        self.assertEqual(prices, sorted(prices, reverse=True))
+
+    def test_cursor_rejects_attribute_ordering(self):
+        response = self.client.get('/products/', {'cursor': '', 'ordering': 'attr.ram'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.json())
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=0)
+class PaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        synthetic.generate_catalogue(5)
+
+    def get(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/products/', params or {})
+        self.assertEqual(response.status_code, 200, response.content)
+        counted = any('COUNT(' in query['sql'].upper() for query in queries)
+        return response.json(), counted
+
+    def add_products(self, count):
+        # saved one by one like the API does: bulk_create sends no signals
+        category = Category.objects.order_by('id').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(count):
+                Product.objects.create(name='New %d' % index, description='', detail={}, old_price=1, new_price=1,
+                                       category=category)
+
+    def test_limit_is_the_page_size(self):
+        data, _ = self.get({'page_size': 4, 'limit': 2})
+        self.assertEqual((data['limit'], len(data['results']), data['total_pages']), (2, 2, 3))
+        data, _ = self.get({'limit': 3})
+        self.assertEqual((data['limit'], len(data['results']), data['total_pages']), (3, 3, 2))
+        # larger than page_size or max_page_size, or not a positive int: no effect
+        data, _ = self.get({'page_size': 4, 'limit': 10})
+        self.assertEqual(data['limit'], 4)
+        data, _ = self.get({'limit': 1000})
+        self.assertEqual(data['limit'], 100)
+        data, _ = self.get({'page_size': 4, 'limit': 'x'})
+        self.assertEqual(data['limit'], 4)
+        data, _ = self.get({'page_size': 2, 'limit': 2, 'page': 3})
+        self.assertEqual([len(data['results']), data['next']], [1, None])
+
+    @override_settings(CATALOGUE_CACHE_SHARED=True)
+    def test_count_cached_until_products_change(self):
+        self.assertTrue(self.get()[1])
+        data, counted = self.get()
+        self.assertFalse(counted)
+        self.assertEqual(data['count'], 5)
+        self.add_products(3)
+        data, counted = self.get()
+        self.assertTrue(counted)
+        self.assertEqual((data['count'], len(data['results'])), (8, 8))
+        # the last page is not cut short by an old count
+        data, _ = self.get({'page_size': 5, 'page': 2})
+        self.assertEqual(len(data['results']), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.order_by('id').first().delete()
+        self.assertEqual(self.get()[0]['count'], 7)
+
+    @override_settings(CATALOGUE_CACHE_SHARED=True)
+    def test_count_cached_per_filter(self):
+        category = Category.objects.order_by('id').first()
+        self.get()
+        data, counted = self.get({'cateId': category.pk})
+        self.assertTrue(counted)
+        self.assertEqual(data['count'], Product.objects.filter(category=category).count())
+
+    @override_settings(CATALOGUE_CACHE_SHARED=False)
+    def test_count_not_cached_without_shared_cache(self):
+        self.get()
+        self.assertTrue(self.get()[1])
+        self.add_products(3)
+        self.assertEqual(self.get()[0]['count'], 8)
+
+
+class CatalogueCacheTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        synthetic.generate_catalogue(3)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                       CATALOGUE_CACHE_SHARED=None)
+    def test_process_local_cache_disables_validators(self):
+        response = self.client.get('/category/')
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('X-Cache', response)
+
+    @override_settings(CATALOGUE_CACHE_SHARED=True)
+    def test_shared_cache_answers_304(self):
+        etag = self.client.get('/category/')['ETag']
+        self.assertEqual(self.client.get('/category/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    @override_settings(CATALOGUE_CACHE_SHARED=True)
+    def test_products_answer_304_until_changed(self):
+        cache.clear()
+        product = Product.objects.order_by('id').first()
+        # every bump happens within the same second as the first request
+        with mock.patch.object(caching, '_now_ms', return_value=1700000000500):
+            for url in ('/products/', '/products/%d/' % product.pk):
+                response = self.client.get(url)
+                etag, last_modified = response['ETag'], response['Last-Modified']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    product.name += ' v2'
+                    product.save()
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+                response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['Last-Modified'], last_modified)
+
+
+@override_settings(CATALOGUE_CACHE_SHARED=True, CATALOGUE_CACHE_TIMEOUT=60)
+class CatalogueInvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        synthetic.generate_catalogue(3, images_per_product=2)
+        self.product = Product.objects.order_by('id').first()
+
+    def change(self, func):
+        # versions are bumped on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+
+    def bumped(self, func):
+        before = {namespace: caching.get_version(namespace) for namespace in caching.NAMESPACES}
+        self.change(func)
+        return {namespace for namespace in caching.NAMESPACES if caching.get_version(namespace) != before[namespace]}
+
+    def rename(self, obj, name):
+        obj.name = name
+        obj.save()
+
+    def test_changes_bump_their_namespaces(self):
+        category = Category.objects.create(name='Tablet')
+        brand = Brand.objects.create(name='Samsung')
+        image = Image.objects.filter(product=self.product).first()
+        product = Product.objects.exclude(pk=self.product.pk).first()
+        cases = [
+            ('product save', lambda: self.rename(self.product, 'Katana 15'), {'products'}),
+            ('product delete', product.delete, {'products'}),
+            ('image save', lambda: Image.objects.create(product=self.product, file='new.jpg'), {'products'}),
+            ('image delete', image.delete, {'products'}),
+            ('category save', lambda: self.rename(category, 'Tablets'), {'categories', 'products'}),
+            ('category delete', category.delete, {'categories', 'products'}),
+            ('brand save', lambda: self.rename(brand, 'Samsung Galaxy'), {'brands', 'products'}),
+            ('brand delete', brand.delete, {'brands', 'products'}),
+        ]
+        for label, func, namespaces in cases:
+            self.assertEqual(self.bumped(func), namespaces, label)
+
+    def assertCached(self, url):
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+    def test_changes_are_not_served_stale(self):
+        detail = '/products/%d/' % self.product.pk
+        category = self.product.category
+        brand = Brand.objects.order_by('id').first()
+        self.assertCached(detail)
+        self.assertCached('/category/%d/' % category.pk)
+        self.assertCached('/brand/')
+
+        self.change(lambda: self.rename(self.product, 'Katana 15'))
+        response = self.client.get(detail)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['name'], 'Katana 15')
+
+        images = len(response.json()['images'])
+        self.change(Image.objects.filter(product=self.product).first().delete)
+        response = self.client.get(detail)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()['images']), images - 1)
+
+        self.change(lambda: self.rename(category, 'Tablets'))
+        response = self.client.get('/category/%d/' % category.pk)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['name'], 'Tablets')
+
+        self.change(lambda: self.rename(brand, 'Samsung'))
+        response = self.client.get('/brand/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Samsung', [row['name'] for row in response.json()])
+
+    def test_stats_count_hits_and_misses(self):
+        admin = synthetic.ensure_customer('admin')
+        admin.is_staff = True
+        admin.save()
+        self.client.force_authenticate(admin)
+        before = self.client.get('/stats/cache/').json()
+        self.assertCached('/category/')
+        self.assertCached('/products/?page_size=2')
+        stats = self.client.get('/stats/cache/').json()
+        self.assertEqual(stats['categories']['hits'], before['categories']['hits'] + 1)
+        self.assertEqual(stats['categories']['misses'], before['categories']['misses'] + 1)
+        self.assertEqual(stats['products']['hits'], before['products']['hits'] + 1)
+        self.assertEqual(stats['products']['misses'], before['products']['misses'] + 1)
+        self.assertEqual(stats['brands'], before['brands'])
+
+
+class CreateOrderValidationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        synthetic.generate_catalogue(3)
+        self.client.force_authenticate(synthetic.ensure_customer())
+        self.product_id = Product.objects.order_by('id').values_list('id', flat=True).first()
+
+    def test_bad_fields_are_400(self):
+        items = json.dumps([{'id': self.product_id, 'quantity': 1}])
+        for url in ('/order/create/', '/async/order/create/'):
+            for data in ({}, {'order_items': items}, {'order_items': '[{', 'order_status': ORDER_STATUS},
+                         {'order_items': items, 'order_status': '[]'}, {'order_items': '{}', 'order_status': ORDER_STATUS}):
+                response = self.client.post(url, data)
+                self.assertEqual(response.status_code, 400, (url, data, response.content))
+        self.assertFalse(Order.objects.exists())
+
+
+class ReceiptAccessTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        synthetic.generate_catalogue(3)
+        self.owner = synthetic.ensure_customer('owner')
+        synthetic.generate_orders(self.owner, 1)
+        self.order = Order.objects.get(user_id=self.owner.pk)
+
+    def test_other_users_receipt_is_404(self):
+        self.client.force_authenticate(synthetic.ensure_customer('other'))
+        for url in ('/order/get-receipt/', '/async/order/get-receipt/'):
+            response = self.client.post(url, {'uuid': json.dumps(str(self.order.uuid))})
+            self.assertEqual(response.status_code, 404, url)
+
+    def test_own_receipt(self):
+        self.client.force_authenticate(self.owner)
+        for url in ('/order/get-receipt/', '/async/order/get-receipt/'):
+            response = self.client.post(url, {'uuid': json.dumps(str(self.order.uuid))})
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response.json()['order']['uuid'], str(self.order.uuid))
+
+    def test_missing_or_invalid_uuid_is_400(self):
+        self.client.force_authenticate(self.owner)
+        for url in ('/order/get-receipt/', '/async/order/get-receipt/'):
+            for data in ({}, {'uuid': 'not-a-uuid'}, {'uuid': '{'}):
+                self.assertEqual(self.client.post(url, data).status_code, 400, (url, data))
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        synthetic.generate_catalogue(2)
+        product = Product.objects.order_by('id').first()
+        self.urls = ['/products/', '/products/%d/' % product.pk, '/order/get-receipt/', '/order/create/']
+
+    def allowed(self, response):
+        return {method.strip() for method in response['Allow'].split(',')}
+
+    def test_methods_match_the_sync_endpoints(self):
+        self.client.force_authenticate(synthetic.ensure_customer())
+        for url in self.urls:
+            allowed = self.allowed(self.client.options(url))
+            self.assertEqual(self.allowed(self.client.options('/async' + url)), allowed, url)
+            for method in ('get', 'post', 'put', 'patch', 'delete'):
+                if method.upper() in allowed:
+                    continue
+                for prefix in ('', '/async'):
+                    response = getattr(self.client, method)(prefix + url)
+                    self.assertEqual(response.status_code, 405, (method, prefix + url))
+                    self.assertEqual(self.allowed(response), allowed, (method, prefix + url))
+        self.assertFalse(Order.objects.exists())
+
+    def test_unauthenticated_is_401_with_challenge(self):
+        for url, method in (('/order/get-receipt/', 'get'), ('/order/get-receipt/', 'post'), ('/order/create/', 'post')):
+            expected = getattr(self.client, method)(url)
+            response = getattr(self.client, method)('/async' + url)
+            self.assertEqual(expected.status_code, 401)
+            self.assertEqual(response.status_code, 401, url)
+            self.assertEqual(response['WWW-Authenticate'], expected['WWW-Authenticate'], url)
+
+
+class OrderSummaryTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        synthetic.generate_catalogue(3)
+        self.user = synthetic.ensure_customer()
+        self.client.force_authenticate(self.user)
+
+    def test_created_order_has_summary(self):
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        response = self.client.post('/order/create/', {
+            'order_items': json.dumps([{'id': product_id, 'quantity': 2} for product_id in product_ids]),
+            'order_status': ORDER_STATUS})
+        self.assertEqual(response.status_code, 201, response.content)
+        summary = Order.objects.get(user_id=self.user.pk).summary
+        self.assertEqual((summary.item_count, summary.total_quantity), (3, 6))
+
+    def test_receipt_and_summary_show_latest_status(self):
+        synthetic.generate_orders(self.user, 1)
+        order = Order.objects.get(user_id=self.user.pk)
+        order.status_order.create(delivery_method='ship', delivery_stage='delivered', payment_method='paypal',
+                                  is_paid=True)
+        receipt = self.client.get('/order/get-receipt/').json()[0]
+        summary = self.client.get('/order/summaries/').json()['results'][0]
+        self.assertEqual(receipt['status']['delivery_stage'], 'delivered')
+        self.assertEqual(summary['delivery_stage'], 'delivered')
+
+
+class SearchTests(TestCase):
+
+    def test_last_term_is_a_prefix(self):
+        category = Category.objects.create(name='Laptop')
+        names = ['MSI Katana gaming', 'MSI Modern', 'Gamepad pro']
+        products = {name: Product.objects.create(name=name, description='', detail={}, old_price=1, new_price=1,
+                                                 category=category) for name in names}
+        found = set(search.search(Product.objects.all(), 'Gam').values_list('pk', flat=True))
+        self.assertEqual(found, {products['MSI Katana gaming'].pk, products['Gamepad pro'].pk})
+        self.assertFalse(search.search(Product.objects.all(), 'gamz').exists())
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=0, PAGINATION_COUNT_CACHE_TIMEOUT=0)
+class AttributeFilterTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        synthetic.generate_catalogue(10)
+
+    def test_lookup_names_are_plain_keys(self):
+        # attr.<key> is compared as a value, never turned into a detail__<key> lookup
+        for name in ('attr.regex', 'attr.contains', 'attr.gt', 'attr.ram__gt', 'attr.has_key'):
+            response = self.client.get('/products/', {name: '(a+)+$', 'facets': 'true'})
+            self.assertEqual(response.status_code, 200, name)
+            self.assertEqual(response.json()['count'], 0, name)
+        self.assertEqual(self.client.get('/products/', {'attr.regex.min': '1'}).json()['count'], 0)
+
+    @override_settings(CATALOGUE_CACHE_SHARED=True, CATALOGUE_CACHE_TIMEOUT=60)
+    def test_facet_names_follow_category_and_brand_renames(self):
+        cache.clear()
+        product = Product.objects.exclude(brand=None).order_by('id').first()
+        params = {'facets': 'true', 'cateId': product.category_id}
+        self.client.get('/products/', params)
+        self.assertEqual(self.client.get('/products/', params)['X-Cache'], 'HIT')
+        for related in (product.category, product.brand):
+            with self.captureOnCommitCallbacks(execute=True):
+                related.name = 'Renamed %s' % type(related).__name__
+                related.save()
+            response = self.client.get('/products/', params)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            facet = 'category' if related is product.category else 'brand'
+            names = {row['id']: row['name'] for row in response.json()['facets'][facet]}
+            self.assertEqual(names[related.pk], related.name)
+
+    def test_attribute_facets(self):
+        details = list(Product.objects.values_list('detail', flat=True))
+        facets = self.client.get('/products/', {'facets': 'true', 'facetAttr': 'cpu,nope'}).json()['facets']
+        cpus = {}
+        for detail in details:
+            cpus[detail['cpu']] = cpus.get(detail['cpu'], 0) + 1
+        self.assertEqual({row['value']: row['count'] for row in facets['attr.cpu']}, cpus)
+        self.assertEqual(facets['attr.nope'], [])
+
+        # an active attribute filter is counted without facetAttr, disjunctively: its own values all stay,
+        # while the other facets only count the matching products
+        facets = self.client.get('/products/', {'facets': 'true', 'attr.ram': '16'}).json()['facets']
+        rams = {}
+        for detail in details:
+            rams[str(detail['ram'])] = rams.get(str(detail['ram']), 0) + 1
+        self.assertEqual({row['value']: row['count'] for row in facets['attr.ram']}, rams)
+        self.assertEqual(sum(row['count'] for row in facets['category']), rams.get('16', 0))
+
+    def test_attribute_filter(self):
+        expected = sum(1 for detail in Product.objects.values_list('detail', flat=True) if detail['ram'] == 16)
+        self.assertEqual(self.client.get('/products/', {'attr.ram': '16'}).json()['count'], expected)
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=0, PAGINATION_COUNT_CACHE_TIMEOUT=0)
+class PreviewImageTests(TestCase):
+
+    def test_grid_and_detail_show_the_same_preview(self):
+        client = APIClient()
+        synthetic.generate_catalogue(1, images_per_product=2)
+        product = Product.objects.get()
+        for n in range(2):
+            product.image_set.create(file='https://res.cloudinary.com/demo/image/upload/extra%d.jpg' % n, preview=True)
+        detail = client.get('/products/%d/' % product.pk, {'image_size': 'thumb'}).json()
+        grid = client.get('/products/', {'view': 'grid', 'image_size': 'thumb'}).json()['results'][0]
+        self.assertEqual(grid['image'], detail['images'][0])
+
+
+def jpeg(name='image.jpg'):
+    from PIL import Image as PILImage
+
+    data = io.BytesIO()
+    PILImage.new('RGB', (40, 30), 'red').save(data, 'JPEG')
+    return SimpleUploadedFile(name, data.getvalue(), content_type='image/jpeg')
+
+
+class UploadTests(TestCase):
+
+    def setUp(self):
+        staging = tempfile.TemporaryDirectory()
+        self.addCleanup(staging.cleanup)
+        self.staging = staging.name
+        staging_settings = override_settings(UPLOAD_STAGING_DIR=staging.name)
+        staging_settings.enable()
+        self.addCleanup(staging_settings.disable)
+        self.client = APIClient()
+
+    def test_pending_image_has_no_url(self):
+        synthetic.generate_catalogue(1)
+        # TestCase never commits, so the background upload never runs and the image stays pending
+        response = self.client.post('/image/', {'file': jpeg(), 'product': Product.objects.get().pk},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['upload_status'], 'pending')
+        self.assertIsNone(response.json()['url'])
+
+    def test_pending_avatar_has_no_image(self):
+        synthetic.ensure_role()
+        response = self.client.post('/users/', {'username': 'pending', 'password': 'secret', 'avatar': jpeg(),
+                                                'first_name': 'A', 'last_name': 'B', 'email': 'a@example.com'},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['avatar_status'], 'pending')
+        self.assertIsNone(response.json()['image'])
+
+    def test_failed_bulk_insert_removes_staged_files(self):
+        synthetic.generate_catalogue(1)
+        with mock.patch.object(Image.objects, 'bulk_create', side_effect=RuntimeError('insert failed')):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/image/bulk/', {'files': [jpeg('a.jpg'), jpeg('b.jpg')],
+                                                  'product': Product.objects.get().pk}, format='multipart')
+        self.assertEqual(os.listdir(self.staging), [])
+
+    def bulk(self, count, **data):
+        with mock.patch('msistore.serializers.enqueue') as enqueue:
+            response = self.client.post('/image/bulk/', {
+                'files': [jpeg('%d.jpg' % n) for n in range(count)], **data}, format='multipart')
+        return response, enqueue
+
+    def assertQueued(self, response, enqueue):
+        self.assertEqual(response.status_code, 201, response.content)
+        images = response.json()
+        self.assertEqual({image['upload_status'] for image in images}, {'pending'})
+        self.assertEqual([call.args for call in enqueue.call_args_list],
+                         [(uploads.process_image, image['id']) for image in images])
+        return images
+
+    def test_bulk_one_product(self):
+        synthetic.generate_catalogue(1, images_per_product=2)
+        product = Product.objects.get()
+        response, enqueue = self.bulk(3, product=product.pk, preview=[1])
+        images = self.assertQueued(response, enqueue)
+        self.assertEqual([image['product'] for image in images], [product.pk] * 3)
+        self.assertEqual([image['preview'] for image in images], [False, True, False])
+        # the new preview replaces the old one
+        previews = Image.objects.filter(product=product, preview=True)
+        self.assertEqual([image.pk for image in previews], [images[1]['id']])
+        # Product.preview_image only points at uploaded images, the new preview takes over once it is done
+        product.refresh_from_db()
+        self.assertEqual(product.preview_image.upload_status, 'done')
+        self.assertEqual(Image.objects.filter(product=product).count(), 5)
+
+    def test_bulk_product_per_file(self):
+        synthetic.generate_catalogue(2, images_per_product=1)
+        first, second = Product.objects.order_by('id')
+        old_preview = Image.objects.get(product=first, preview=True)
+        response, enqueue = self.bulk(3, products=[first.pk, second.pk, first.pk], preview=[1])
+        images = self.assertQueued(response, enqueue)
+        self.assertEqual([image['product'] for image in images], [first.pk, second.pk, first.pk])
+        self.assertEqual(list(Image.objects.filter(product=first, preview=True)), [old_preview])
+        self.assertEqual(list(Image.objects.filter(product=second, preview=True).values_list('pk', flat=True)),
+                         [images[1]['id']])
+
+    def test_bulk_invalid(self):
+        synthetic.generate_catalogue(2, images_per_product=1)
+        first, second = Product.objects.order_by('id').values_list('pk', flat=True)
+        cases = [
+            ({'products': [first, second]}, 'products'),
+            ({'products': [first, first, second], 'preview': [0, 1]}, 'preview'),
+            ({'product': first, 'preview': [3]}, 'preview'),
+            ({'products': [first, second, 0]}, 'products'),
+            ({'product': 0}, 'products'),
+            ({}, 'product'),
+        ]
+        for data, field in cases:
+            response, enqueue = self.bulk(3, **data)
+            self.assertEqual(response.status_code, 400, data)
+            self.assertIn(field, response.json(), data)
+            enqueue.assert_not_called()
+        self.assertEqual(Image.objects.count(), 2)
+        self.assertEqual(os.listdir(self.staging), [])
+
+    def test_remove_orphaned_files(self):
+        synthetic.generate_catalogue(1)
+        self.client.post('/image/', {'file': jpeg(), 'product': Product.objects.get().pk}, format='multipart')
+        orphan = os.path.join(self.staging, 'orphan.jpg')
+        open(orphan, 'wb').close()
+        os.utime(orphan, (0, 0))
+        self.assertEqual(uploads.remove_orphaned_files(max_age=3600), 1)
+        self.assertEqual(os.listdir(self.staging), [Image.objects.get(upload_status='pending').file.name])
+
+    def test_failed_variant_removes_uploaded_variants(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        path = uploads.staged_path(uploads.stage(jpeg()))
+        upload = storage.LocalStorage.upload
+        calls = []
+
+        def fail_third(self, variant_path, **options):
+            calls.append(variant_path)
+            if len(calls) == 3:
+                raise OSError('storage unavailable')
+            return upload(self, variant_path, **options)
+
+        with override_settings(IMAGE_STORAGE_BACKEND='msistore.storage.LocalStorage', MEDIA_ROOT=media.name,
+                               UPLOAD_MAX_RETRIES=0), \
+                mock.patch.object(storage.LocalStorage, 'upload', fail_third):
+            with self.assertRaises(OSError):
+                uploads.upload_derivatives(path)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(os.listdir(media.name), [])
+        self.assertEqual(os.listdir(self.staging), [os.path.basename(path)])
+
+
+class RendererTests(TestCase):
+
+    def assertSameOutput(self, data):
+        self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data), data)
+
+    def test_output_matches_drf(self):
+        moment = datetime.datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+        self.assertSameOutput({
+            'price': decimal.Decimal('199000.50'),
+            'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'date': datetime.date(2024, 5, 1),
+            'datetime': moment,
+            'naive': moment.replace(tzinfo=None),
+            'time': datetime.time(8, 15),
+            'lazy': gettext_lazy('Not found.'),
+            'text': 'Điện thoại \u2028 \u2029 <script>',
+            'nested': [1, 2.5, None, True, {'a': []}],
+        })
+        self.assertSameOutput(None)
+
+    def test_big_integers_fall_back_to_drf(self):
+        for value in (2 ** 64, -2 ** 63 - 1, [1, {'id': 10 ** 30}]):
+            self.assertSameOutput(value)
+
+    def test_floats_keep_their_value(self):
+        data = [1e16, 0.1, -2.5e-7, 3.0]
+        self.assertEqual(json.loads(renderers.FastJSONRenderer().render(data)), data)
+
+    def test_parser(self):
+        parser = renderers.FastJSONParser()
+        data = parser.parse(io.BytesIO('{"name": "Áo", "ids": [1, 2]}'.encode()))
+        self.assertEqual(data, {'name': 'Áo', 'ids': [1, 2]})
+        for body in (b'{"name": ', b'\xff', b''):
+            with self.assertRaises(ParseError):
+                parser.parse(io.BytesIO(body))
+
+
+@override_settings(CATALOGUE_CACHE_TIMEOUT=0, PAGINATION_COUNT_CACHE_TIMEOUT=0)
+class FastPathContractTests(TestCase):
+    """PRODUCT_LIST_FAST_PATH must render /products/ byte for byte like ProductListSerializer."""
+
+    def setUp(self):
+        self.client = APIClient()
+        synthetic.generate_catalogue(30)
+        products = list(Product.objects.order_by('id'))
+        Product.objects.filter(pk=products[0].pk).update(brand=None)
+        image = products[1].image_set.order_by('id').first()
+        Image.objects.filter(pk=image.pk).update(thumb_url='https://res.cloudinary.com/demo/image/upload/t.webp')
+        products[2].image_set.create(file='pending-upload.jpg', upload_status='pending')
+        products[3].image_set.create(file='https://res.cloudinary.com/demo/image/upload/p.jpg', preview=True)
+
+    def test_identical_output(self):
+        category_id = Category.objects.order_by('id').values_list('id', flat=True).first()
+        combinations = [
+            {},
+            {'page': 2, 'page_size': 10},
+            {'cateId': category_id, 'fromPrice': 500, 'toPrice': 5000},
+            {'kw': 'gaming'},
+            {'ordering': 'attr.weight'},
+            {'ordering': '-price'},
+            {'cursor': '', 'ordering': 'price'},
+            {'fields': 'id,name,new_price'},
+            {'fields': 'brand,images', 'image_size': 'thumb'},
+            {'facets': 'true'},
+        ]
+        for params in combinations:
+            bodies = []
+            for fast_path in (False, True):
+                with override_settings(PRODUCT_LIST_FAST_PATH=fast_path):
+                    response = self.client.get('/products/', params)
+                self.assertEqual(response.status_code, 200, response.content)
+                bodies.append(response.content)
+            self.assertEqual(bodies[0], bodies[1], params)
+
+
+class FakeReplicaCursor:
+    # answers only the statements in ``results``: {sql: (columns, row)}
+
+    def __init__(self, results):
+        self.results = results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql):
+        if sql not in self.results:
+            raise DatabaseError('You have an error in your SQL syntax')
+        columns, self.row = self.results[sql]
+        self.description = [(column,) for column in columns]
+
+    def fetchone(self):
+        return self.row
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        synthetic.generate_catalogue(5, images_per_product=2)
+        self.product = Product.objects.order_by('id').first()
+        # a preview added after the other images, and an upload still pending
+        Image.objects.filter(product=self.product).update(preview=False)
+        Image.objects.create(product=self.product, file='front.jpg', preview=True)
+        Image.objects.create(product=self.product, file='pending.jpg', upload_status=UploadStatus.PENDING)
+
+    def expected_images(self, product):
+        images = Image.objects.filter(product=product, upload_status=UploadStatus.DONE).order_by('-preview', 'id')
+        return [image.file.name for image in images]
+
+    def login_staff(self):
+        admin = synthetic.ensure_customer('admin')
+        admin.is_staff = True
+        admin.save()
+        self.client.force_authenticate(admin)
+
+    def export(self, output):
+        self.login_staff()
+        response = self.client.get('/products/export/', {'output': output})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        self.assertEqual([row['id'] for row in rows], list(Product.objects.order_by('id').values_list('id', flat=True)))
+        for row in rows:
+            self.assertEqual(list(row), exports.FIELDS)
+        first = rows[0]
+        self.assertEqual(first['images'][0], 'front.jpg')
+        self.assertNotIn('pending.jpg', first['images'])
+        self.assertEqual(first['images'], self.expected_images(self.product))
+        self.assertEqual(first['category_name'], self.product.category.name)
+        self.assertEqual(first['detail'], self.product.detail)
+        self.assertEqual(first['new_price'], str(self.product.new_price))
+
+    def test_csv(self):
+        reader = csv.DictReader(io.StringIO(self.export('csv')))
+        self.assertEqual(reader.fieldnames, exports.FIELDS)
+        rows = list(reader)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['images'].split(' '), self.expected_images(self.product))
+        self.assertEqual(json.loads(rows[0]['detail']), self.product.detail)
+
+    def test_chunks(self):
+        ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        for chunk_size in (1, 2, 5, 10):
+            with CaptureQueriesContext(connection) as queries:
+                rows = [json.loads(line) for line in exports.export_lines('ndjson', chunk_size=chunk_size)]
+            self.assertEqual([row['id'] for row in rows], ids, chunk_size)
+            self.assertEqual(rows[0]['images'], self.expected_images(self.product))
+            # products + images per chunk, and the empty read that ends the loop
+            chunks = -(-len(ids) // chunk_size)
+            self.assertEqual(len(queries), 2 * chunks + 1, chunk_size)
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/products/export/').status_code, 401)
+        self.client.force_authenticate(synthetic.ensure_customer())
+        self.assertEqual(self.client.get('/products/export/').status_code, 403)
+
+    def test_bad_output(self):
+        self.login_staff()
+        self.assertEqual(self.client.get('/products/export/', {'output': 'xml'}).status_code, 400)
+
+    def test_throttled(self):
+        with mock.patch.object(perms.ExportRateThrottle, 'THROTTLE_RATES', {'export': '2/hour'}):
+            self.export('ndjson')
+            self.export('csv')
+            self.assertEqual(self.client.get('/products/export/').status_code, 429)
+
+
+class ReplicaLagTests(TestCase):
+
+    def lag(self, results):
+        replica = mock.Mock(vendor='mysql')
+        replica.cursor.side_effect = lambda: FakeReplicaCursor(results)
+        with mock.patch.object(db_routers, 'connections', {'replica1': replica}):
+            return db_routers.replica_lag('replica1')
+
+    def test_replica_status(self):
+        self.assertEqual(self.lag({'SHOW REPLICA STATUS': (['Seconds_Behind_Source'], (3,))}), 3)
+
+    def test_falls_back_to_slave_status(self):
+        self.assertEqual(self.lag({'SHOW SLAVE STATUS': (['Seconds_Behind_Master'], (7,))}), 7)
+
+    def test_not_a_replica(self):
+        self.assertEqual(self.lag({'SHOW REPLICA STATUS': (['Seconds_Behind_Source'], None)}), 0)
+
+    def test_unreadable(self):
+        self.assertIsNone(self.lag({}))
+
+
+@mock.patch.object(db_routers, 'healthy_replicas', lambda: ['replica1'])
+class ReplicaPinningTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = synthetic.ensure_customer()
+        self.other = synthetic.ensure_customer('other')
+
+    def request(self, method, user):
+        request = getattr(RequestFactory(), method)('/')
+        # as AuthenticationMiddleware leaves it: not evaluated
+        request.user = SimpleLazyObject(AnonymousUser)
+        request.api_user = user
+        return request
+
+    def view(self, write=False):
+        reads = []
+
+        def view(request):
+            reads.append(db_routers.ReplicaRouter().db_for_read(Product))  # e.g. the token lookup
+            request.user = request.api_user  # what DRF does once the request is authenticated
+            if write:
+                db_routers.ReplicaRouter().db_for_write(Product)
+            reads.append(db_routers.ReplicaRouter().db_for_read(Product))
+            return HttpResponse()
+        return view, reads
+
+    def call(self, method, user=None, write=False):
+        view, reads = self.view(write)
+        db_routers.ReplicaPinningMiddleware(view)(self.request(method, user or self.user))
+        return reads
+
+    def test_pinned_after_write(self):
+        self.assertEqual(self.call('get'), ['replica1', 'replica1'])
+        self.assertEqual(self.call('post'), ['default', 'default'])
+        self.assertEqual(self.call('get'), ['replica1', 'default'])
+        # keyed by user id: other users keep reading from the replicas
+        self.assertEqual(self.call('get', self.other), ['replica1', 'replica1'])
+
+    def test_write_in_safe_request(self):
+        self.assertEqual(self.call('get', write=True), ['replica1', 'default'])
+        self.assertEqual(self.call('get'), ['replica1', 'default'])
+
+    def test_pin_expires(self):
+        with override_settings(REPLICA_PIN_SECONDS=0):
+            self.call('post')
+        self.assertEqual(self.call('get'), ['replica1', 'replica1'])
+
+    def test_anonymous_write(self):
+        self.call('post', AnonymousUser())
+        self.assertEqual(self.call('get'), ['replica1', 'replica1'])
+
+    def test_outside_request(self):
+        self.assertEqual(db_routers.ReplicaRouter().db_for_read(Product), 'default')
+
+    def test_async(self):
+        view, reads = self.view(write=True)
+
+        async def async_view(request):
+            # sync view code runs in a sync_to_async thread under ASGI
+            return await sync_to_async(view)(request)
+
+        middleware = db_routers.ReplicaPinningMiddleware(async_view)
+        async_to_sync(middleware)(self.request('get', self.user))
+        self.assertEqual(reads, ['replica1', 'default'])
+        self.assertEqual(self.call('get'), ['replica1', 'default'])
+
+
+class RequestMetricsTests(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        synthetic.generate_catalogue(20)
+        self.user = synthetic.ensure_customer()
+        synthetic.generate_orders(self.user, 5)
+        self.client.force_authenticate(self.user)
+
+    def budgeted_requests(self):
+        product = Product.objects.order_by('id').first()
+        order = Order.objects.filter(user_id=self.user.pk).first()
+        product_ids = Product.objects.order_by('id').values_list('id', flat=True)[:20]
+        cart = json.dumps([{'id': product_id, 'quantity': 1} for product_id in product_ids])
+        return [
+            ('product-list', 'get', '/products/', None),
+            ('product-detail', 'get', '/products/%d/' % product.pk, None),
+            ('category-list', 'get', '/category/', None),
+            ('brand-list', 'get', '/brand/', None),
+            ('order-get-receipt', 'get', '/order/get-receipt/', None),
+            ('order-get-receipt', 'post', '/order/get-receipt/', {'uuid': json.dumps(str(order.uuid))}),
+            ('order-summaries', 'get', '/order/summaries/', None),
+            ('order-create-order', 'post', '/order/create/', {'order_items': cart, 'order_status': ORDER_STATUS}),
+        ]
+
+    def test_budgets_cover_views(self):
+        self.assertEqual({view for view, *_ in self.budgeted_requests()}, set(settings.QUERY_BUDGETS))
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_within_budget(self):
+        for view, method, url, data in self.budgeted_requests():
+            with self.subTest(view=view, method=method):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.request(method, url, data)
+                self.assertIn('desc="%d queries"' % len(queries), response['Server-Timing'])
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_over_budget_raises(self):
+        for view, method, url, data in self.budgeted_requests():
+            with self.subTest(view=view, method=method):
+                budget = self.count_queries(method, url, data) - 1
+                with override_settings(QUERY_BUDGETS={view: budget}):
+                    with self.assertRaises(instrumentation.QueryBudgetExceeded):
+                        getattr(self.client, method)(url, data)
+
+    def test_async_view_queries(self):
+        def query():
+            # a new thread, so a connection of its own; no tables, the test transaction holds their locks
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.execute('SELECT 2')
+
+        async def view(request):
+            await sync_to_async(query, thread_sensitive=False)()
+            return HttpResponse()
+
+        middleware = instrumentation.RequestMetricsMiddleware(view)
+        response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+
+# CI-sized version of the benchmark dataset (manage.py benchmark defaults to 100k products)
+BENCHMARK_DATASET = {'products': 40, 'images_per_product': 2, 'users': 4, 'orders': 20, 'likes': 20, 'seed': 0}
+
+
+class BenchmarkRegressionTests(QueryCountTestCase):
+    """
+    The benchmark scenarios on a small dataset: no timings, which vary too much
+    between CI machines, only their query counts.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        synthetic.ensure_dataset(**BENCHMARK_DATASET)
+
+    def grow(self):
+        synthetic.ensure_dataset(products=80, users=6, orders=60, likes=40, seed=1)
+
+    def test_dataset(self):
+        counts = synthetic.dataset_counts()
+        self.assertEqual(counts['products'], 40)
+        self.assertEqual(counts['images'], 80)
+        self.assertEqual(counts['orders'], 20)
+        self.assertEqual(counts['likes'], 20)
+        # same counts again: nothing added, so runs are comparable
+        synthetic.ensure_dataset(**BENCHMARK_DATASET)
+        self.assertEqual(synthetic.dataset_counts(), counts)
+
+    def test_serializers(self):
+        results = benchmarks.SCENARIOS['serializers'](dict(BENCHMARK_DATASET, repeat=1))
+        self.assertEqual(len(results), 14)
+        # instances are loaded like the views load them: serializing must not query
+        for name, stats in results.items():
+            self.assertEqual(stats['queries'], 0, name)
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_endpoints(self):
+        user = benchmarks.endpoint_customer()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % benchmarks.access_token(user))
+        expected = {label: self.count_queries(method, url, data)
+                    for label, (method, url, data) in benchmarks.endpoint_requests().items()}
+        self.grow()
+        for label, (method, url, data) in benchmarks.endpoint_requests().items():
+            with self.subTest(label):
+                with self.assertNumQueries(expected[label]):
+                    self.request(method, url, data)
@@ -0,0 +1,193 @@
+"""
+Background upload pipeline for Image.file and User.avatar.
+
+The request only stages the file on local disk and saves the row with
+``upload_status = 'pending'`` and the staged file name; after the transaction
+commits a worker thread uploads it to the storage backend (with retries) and
+stores the final URL; product images also get thumb/medium/large variants
+(see derivatives.py). Rows left pending (e.g. after a restart) can be picked up
+again with ``python manage.py process_uploads``.
+"""
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Image, UploadStatus, User
+from .derivatives import make_derivatives
+from .storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.UPLOAD_WORKERS, thread_name_prefix='upload')
+    return _executor
+
+
+def staged_path(name):
+    return os.path.join(str(settings.UPLOAD_STAGING_DIR), name)
+
+
+def stage(file):
+    """Write an uploaded file to the staging directory and return its staged name."""
+    os.makedirs(str(settings.UPLOAD_STAGING_DIR), exist_ok=True)
+    extension = os.path.splitext(getattr(file, 'name', '') or '')[1].lower()
+    name = '%s%s' % (uuid.uuid4().hex, extension)
+    with open(staged_path(name), 'wb') as destination:
+        for chunk in file.chunks():
+            destination.write(chunk)
+    return name
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def staged_files(files):
+    """
+    Stage ``files`` and yield their names, for the rows saved in the block. If
+    the block raises, its rows were not saved (the transaction rolled back and
+    on_commit never runs), so the staged files are deleted instead of staying
+    in UPLOAD_STAGING_DIR forever. Open the block outside the transaction.
+    """
+    names = []
+    try:
+        for file in files:
+            names.append(stage(file))
+        yield names
+    except BaseException:
+        for name in names:
+            _remove(staged_path(name))
+        raise
+
+
+def remove_orphaned_files(max_age):
+    """
+    Delete staged files older than ``max_age`` seconds that no pending or failed
+    row points to (e.g. the request's transaction rolled back after the staging
+    block, or the process died). Returns the number of files deleted.
+    """
+    directory = str(settings.UPLOAD_STAGING_DIR)
+    if not os.path.isdir(directory):
+        return 0
+    waiting = [UploadStatus.PENDING, UploadStatus.FAILED]
+    referenced = set(Image.objects.filter(upload_status__in=waiting).values_list('file', flat=True))
+    referenced.update(User.objects.filter(avatar_status__in=waiting).values_list('avatar', flat=True))
+    count = 0
+    for name in os.listdir(directory):
+        path = staged_path(name)
+        if name not in referenced and os.path.isfile(path) and time.time() - os.path.getmtime(path) > max_age:
+            _remove(path)
+            count += 1
+    return count
+
+
+def upload_with_retry(path):
+    storage = get_storage()
+    attempts = settings.UPLOAD_MAX_RETRIES + 1
+    for attempt in range(attempts):
+        try:
+            return storage.upload(path)
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            logger.warning('Upload of %s failed (attempt %d/%d), retrying', path, attempt + 1, attempts,
+                           exc_info=True)
+            time.sleep(settings.UPLOAD_RETRY_DELAY * 2 ** attempt)
+
+
+def upload_derivatives(path):
+    """
+    Generate and upload the resized variants of ``path``; return {'<size>_url': url}.
+    All or nothing: when a variant fails, the ones already uploaded are deleted
+    from the storage before the error is raised. Local variant files are always removed.
+    """
+    variant_paths = make_derivatives(path)
+    urls = {}
+    try:
+        for size, variant_path in variant_paths.items():
+            urls['%s_url' % size] = upload_with_retry(variant_path)
+    except Exception:
+        storage = get_storage()
+        for url in urls.values():
+            try:
+                storage.delete(url)
+            except Exception:
+                logger.warning('Could not delete orphaned variant %s', url, exc_info=True)
+        raise
+    finally:
+        for variant_path in variant_paths.values():
+            _remove(variant_path)
+    return urls
+
+
+def _process(model, pk, field, status_field, derivatives=False):
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or getattr(instance, status_field) == UploadStatus.DONE:
+        return
+    path = staged_path(getattr(instance, field).name)
+    try:
+        url = upload_with_retry(path)
+    except Exception:
+        logger.exception('Upload of %s %s failed', model.__name__, pk)
+        setattr(instance, status_field, UploadStatus.FAILED)
+        instance.save(update_fields=[status_field])
+        return
+    setattr(instance, field, url)
+    setattr(instance, status_field, UploadStatus.DONE)
+    update_fields = [field, status_field]
+
+    if derivatives:
+        # a failed thumbnail does not fail the upload, clients use the original image
+        try:
+            variant_urls = upload_derivatives(path)
+        except Exception:
+            logger.exception('Derivatives of %s %s failed', model.__name__, pk)
+        else:
+            for name, variant_url in variant_urls.items():
+                setattr(instance, name, variant_url)
+            update_fields.extend(variant_urls)
+
+    # save() (not update()) so that the cache/preview signals still run
+    instance.save(update_fields=update_fields)
+    os.remove(path)
+
+
+def process_image(pk):
+    _process(Image, pk, 'file', 'upload_status', derivatives=True)
+
+
+def process_avatar(pk):
+    _process(User, pk, 'avatar', 'avatar_status')
+
+
+def _run_in_worker(func, *args):
+    try:
+        func(*args)
+    finally:
+        # each thread has its own DB connection, close it after every job
+        close_old_connections()
+
+
+def enqueue(func, *args):
+    """Run ``func(*args)`` after the current transaction commits, in the pool if UPLOAD_ASYNC."""
+    def submit():
+        if settings.UPLOAD_ASYNC:
+            get_executor().submit(_run_in_worker, func, *args)
+        else:
+            func(*args)
+    transaction.on_commit(submit)
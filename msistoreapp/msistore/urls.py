@@ -13,7 +13,10 @@ r.register('userinfo', views.UserInfoViewSet)
 r.register('order', views.OrderViewSet)
 r.register('order-item', views.OrderItemViewSet)
 r.register('status-order', views.StatusOrderViewSet)
+r.register('stats', views.StatsViewSet, basename='stats')
 
 urlpatterns = [
-    path('', include(r.urls))
+    path('', include(r.urls)),
+    # async (ASGI) versions of the hot endpoints, see msistore/async_views.py
+    path('async/', include('msistore.async_urls')),
 ]
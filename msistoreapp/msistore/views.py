@@ -1,19 +1,28 @@
+from django.conf import settings
 from django.db import transaction
-from django.http import Http404, HttpResponse
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
 from rest_framework import viewsets, generics, permissions, parsers, status
 from rest_framework.decorators import action
 from rest_framework.views import Response
-from .models import User, Category, Brand, Image, Product, Like, UserInfo, Order, OrderItem, StatusOrder
-from .pagination import CustomPagination
+from .models import User, Category, Brand, Image, Product, Like, UserInfo, Order, OrderItem, StatusOrder, OrderSummary
+from .filters import ProductFilter, order_by_attribute
+from .pagination import CustomPagination, ProductCursorPagination, ReceiptPagination
 from .serializers import (
     UserSerializer, CategorySerializer, BrandSerializer, ImageSerializer, ProductSerializer, LikeSerializer,
-    UserInfoSerializer, OrderSerializer, OrderItemSerializer, StatusOrderSerializer
+    UserInfoSerializer, OrderSerializer, OrderItemSerializer, StatusOrderSerializer, ReceiptSerializer,
+    OrderSummarySerializer, BulkImageSerializer, ProductGridSerializer, ProductListSerializer
 )
 import json
-from .perms import UserInfoOwner
+from uuid import UUID
+from .perms import ExportRateThrottle, UserInfoOwner
+from . import exports, fastpath, search
+from .caching import cache_response, cache_stats, conditional_response
+from .dbstats import db_stats
+from .instrumentation import prometheus_metrics
 
 
 class UserViewSet(viewsets.ViewSet, generics.CreateAPIView):
@@ -50,56 +59,158 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView):
 
 
 class ProductViewSet(viewsets.ViewSet, generics.ListAPIView,generics.RetrieveAPIView):
-    queryset = Product.objects.all()
+    queryset = Product.objects.order_by('id')
     serializer_class = ProductSerializer
     pagination_class = CustomPagination
-
+    cursor_pagination_class = ProductCursorPagination
+
+    # heavy columns are only loaded when the serializer outputs them
+    DEFERRABLE_FIELDS = ['description', 'detail']
+
+    def is_grid(self):
+        # ?view=grid: compact list for the product grid, see ProductGridSerializer
+        return self.action == 'list' and self.request.query_params.get('view') == 'grid'
+
+    def requested_fields(self):
+        # ?fields=id,name,new_price (sparse fieldset), None = all. Unknown names are dropped, and a
+        # filter naming no field of the serializer is ignored rather than producing empty objects
+        names = [name.strip() for name in self.request.query_params.get('fields', '').split(',') if name.strip()]
+        known = self.get_serializer_class().Meta.fields
+        return [name for name in names if name in known] or None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        fields = set(self.requested_fields() or serializer_class.Meta.fields)
+        # only load the images when they are part of the output
+        if self.is_grid():
+            if 'image' in fields:
+                queryset = ProductGridSerializer.setup_eager_loading(queryset)
+        elif 'images' in fields:
+            queryset = ProductSerializer.setup_eager_loading(queryset)
+        deferred = [name for name in self.DEFERRABLE_FIELDS if name not in fields]
+        return queryset.defer(*deferred) if deferred else queryset
+
+    def get_serializer_class(self):
+        if self.is_grid():
+            return ProductGridSerializer
+        if self.action == 'list':
+            return ProductListSerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    @property
+    def paginator(self):
+        # ?cursor= switches to keyset pagination (no OFFSET, no COUNT)
+        if not hasattr(self, '_paginator'):
+            if self.cursor_pagination_class.cursor_query_param in self.request.query_params:
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def filter_products(self, queryset, params):
+        # cateId, brandId, price, attr.<key>... see msistore/filters.py
+        queryset = ProductFilter(params).filter(queryset, exclude='kw')
+        kw = params.get('kw')
+        if kw:
+            # search the inverted index, results sorted by relevance
+            queryset = search.search(queryset, kw)
+        # ?ordering replaces the relevance order of kw. price / -price work in both pagination modes
+        # (the cursor paginator applies its own ORDER BY), attr.<key> only with page numbers
+        ordering = params.get('ordering')
+        if ordering in self.cursor_pagination_class.orderings:
+            queryset = queryset.order_by(*self.cursor_pagination_class.orderings[ordering])
+        elif ordering:
+            queryset = order_by_attribute(queryset, ordering)
+        return queryset
+
+    @conditional_response('products')
+    @cache_response('products')
     def list(self, request, *args, **kwargs):
-        # Get the custom limit from the query parameter or use a default
-        limit = int(request.query_params.get('limit', 100))
         # Retrieve the queryset
-        queryset = self.filter_queryset(self.get_queryset())
-        kw = request.query_params.get('kw')
-        cateId = request.query_params.get('cateId')
-        fromPrice = request.query_params.get('fromPrice')
-        toPrice = request.query_params.get('toPrice')
+        queryset = self.filter_products(self.filter_queryset(self.get_queryset()), request.query_params)
+
+        # PRODUCT_LIST_FAST_PATH: read .values() and output the dicts directly, no serializer (msistore/fastpath.py)
+        fast_path = settings.PRODUCT_LIST_FAST_PATH and not self.is_grid()
+        if fast_path:
+            fields = fastpath.list_fields(self.requested_fields())
+            queryset = fastpath.product_values(queryset, fields)
 
-        if kw:
-            queryset = queryset.filter(name__contains=kw, description__contains=kw)
-        if cateId:
-            queryset = queryset.filter(category_id=cateId)
-        if fromPrice and toPrice:
-            queryset = queryset.filter(new_price__range=(fromPrice, toPrice))
-        elif fromPrice:
-            queryset = queryset.filter(new_price__gt=fromPrice)
-
-        # if fromPrice = queryset.filter(category_id= )
         # Apply pagination
         page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            response_data = self.get_paginated_response(serializer.data).data
-            response_data['limit'] = limit  # Add the custom limit to the response
-            return Response(response_data)
-
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        rows = page if page is not None else queryset
+        if fast_path:
+            data = fastpath.serialize_products(rows, request, fields)
+        else:
+            data = self.get_serializer(rows, many=True).data
+        # limit / total_pages are added by CustomPagination
+        response = self.get_paginated_response(data) if page is not None else Response(data)
+
+        if request.query_params.get('facets') in ('1', 'true') and page is not None:
+            # counts per category / brand / price range for the filter sidebar
+            response.data['facets'] = ProductFilter(request.query_params).facet_counts(Product.objects.all())
+        return response
+
+    @conditional_response('products')
+    @cache_response('products')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(methods=['get'], detail=False, url_path='export', permission_classes=[permissions.IsAdminUser],
+            throttle_classes=[ExportRateThrottle])
+    def export(self, request):
+        # Streams the whole catalogue (?output=ndjson|csv), no pagination; staff only and throttled
+        # (REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']['export']) since every call reads every product
+        output = request.query_params.get('output', 'ndjson')
+        if output not in exports.CONTENT_TYPES:
+            return Response({"errors": "output must be one of: %s" % ', '.join(exports.CONTENT_TYPES)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(exports.export_lines(output), content_type=exports.CONTENT_TYPES[output])
+        response['Content-Disposition'] = 'attachment; filename="products.%s"' % output
+        return response
 
 
 class CategoryViewSet(viewsets.ViewSet, generics.ListAPIView, generics.RetrieveAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
+    @conditional_response('categories')
+    @cache_response('categories')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response('categories')
+    @cache_response('categories')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class BrandViewSet(viewsets.ViewSet, generics.ListAPIView):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
 
+    @conditional_response('brands')
+    @cache_response('brands')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class ImageViewSet(viewsets.ViewSet, generics.CreateAPIView):
     queryset = Image.objects.all()
     serializer_class = ImageSerializer
 
+    @action(methods=['post'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        serializer = BulkImageSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        images = serializer.save()
+        return Response(ImageSerializer(images, many=True, context={'request': request}).data,
+                        status=status.HTTP_201_CREATED)
+
 
 class LikeViewSet(viewsets.ViewSet, generics.ListAPIView):
     queryset = Like.objects.all()
@@ -123,30 +234,87 @@ class OrderViewSet(viewsets.ViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    MAX_ITEM_QUANTITY = 999  # OrderItem.quantity is a CharField(max_length=3)
+
+    def parse_order_request(self, data):
+        """
+        Decode the order_items (list) and order_status (object) form fields, sent
+        as JSON strings. Returns (order_items, order_status, errors).
+        """
+        try:
+            order_items, order_status = [json.loads(value) if isinstance(value, (str, bytes)) else value
+                                         for value in (data.get('order_items'), data.get('order_status'))]
+        except ValueError:
+            return None, None, {"errors": "order_items and order_status must be valid JSON"}
+        if not isinstance(order_items, list) or not isinstance(order_status, dict):
+            return None, None, {"errors": "order_items must be a JSON list and order_status a JSON object"}
+        return order_items, order_status, None
+
+    def parse_cart(self, order_items_data):
+        """Validate the shape of the cart and return (lines, errors), lines being (product_id, quantity) pairs."""
+        try:
+            lines = [(int(item['id']), int(item['quantity'])) for item in order_items_data]
+        except (KeyError, TypeError, ValueError):
+            return None, {"errors": "order_items must be a list of {id, quantity}"}
+        if not lines:
+            return None, {"errors": "order_items is empty"}
+        if any(not 0 < quantity <= self.MAX_ITEM_QUANTITY for _, quantity in lines):
+            return None, {"errors": "quantity must be between 1 and %d" % self.MAX_ITEM_QUANTITY}
+        return lines, None
+
+    def cart_products(self, lines):
+        return Product.objects.filter(id__in={product_id for product_id, _ in lines}, is_active=True)
+
+    def match_cart(self, lines, products):
+        # products: {id: Product} of the cart's products that are still active
+        invalid = sorted({product_id for product_id, _ in lines if product_id not in products})
+        if invalid:
+            return None, {"errors": "products do not exist or are inactive", "invalid_products": invalid}
+        return [(products[product_id], quantity) for product_id, quantity in lines], None
+
+    def get_order_lines(self, order_items_data):
+        """
+        Validate the cart and return (lines, errors), lines being (product, quantity)
+        pairs. All product ids are checked with a single query.
+        """
+        lines, errors = self.parse_cart(order_items_data)
+        if errors:
+            return None, errors
+        return self.match_cart(lines, self.cart_products(lines).in_bulk())
+
+    def save_order(self, user, lines, order_status_data):
+        with transaction.atomic():
+            order = Order.objects.create(user_id=user.id)
+            # 1 INSERT for all items, keeping the price at the time of purchase
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=str(quantity), price=product.new_price)
+                for product, quantity in lines
+            ])
+
+            # Create and save StatusOrder associated with the Order
+            order_status_data['order'] = order.id
+            order_status = StatusOrderSerializer(data=order_status_data)
+            order_status.is_valid(raise_exception=True)
+            # the post_save signal of StatusOrder builds the OrderSummary, items included
+            order_status.save()
+        return order
+
     @action(methods=['post'], detail=False, url_path='create')
     def create_order(self, request):
-        order_items_data = json.loads(request.data.get('order_items'))
-        order_status_data = json.loads(request.data.get('order_status'))
-
         user = request.user
         if user.is_anonymous:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
-        else:
-            # # Serialize and save the Order
-            with transaction.atomic():
-                order = Order.objects.create(user_id=user.id)
-
-                for order_item in order_items_data:
-                    order_item['order'] = order.id
-                    OrderItem.objects.create(order_id=order.id, product_id=order_item['id'],
-                                             quantity=order_item['quantity'])
-
-                order_status_data['order'] = order.id
-                order_status = StatusOrderSerializer(data=order_status_data)
-                order_status.is_valid(raise_exception=True)
-                order_status.save()
-                # Create and save StatusOrder associated with the Order
-                return Response(order.uuid, status=status.HTTP_201_CREATED)
+
+        order_items_data, order_status_data, errors = self.parse_order_request(request.data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        lines, errors = self.get_order_lines(order_items_data)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        order = self.save_order(user, lines, order_status_data)
+        return Response(order.uuid, status=status.HTTP_201_CREATED)
 
     @action(methods=['post'], detail=False, url_path='payment')
     def getPaypalClient(self, request):
@@ -156,38 +324,62 @@ class OrderViewSet(viewsets.ViewSet):
         }
         return Response(data, status=status.HTTP_200_OK)
 
+    def get_receipt_queryset(self):
+        # prefetch items -> product -> images, statuses and products once for all orders:
+        # the number of queries does not depend on how many orders the user has
+        items = OrderItemSerializer.setup_eager_loading(OrderItem.objects.order_by('id'))
+        return Order.objects.prefetch_related(
+            Prefetch('order_item_order', queryset=items),
+            Prefetch('status_order', queryset=StatusOrder.objects.order_by('-id')),
+            'products',
+        ).select_related('summary').order_by('id')
+
+    def parse_receipt_uuid(self, data):
+        """Order uuid of a POST get-receipt (a JSON string or a bare uuid), None when missing or invalid."""
+        value = data.get('uuid')
+        if isinstance(value, (str, bytes)):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        try:
+            return UUID(str(value)) if value else None
+        except ValueError:
+            return None
+
     @action(methods=['post', 'get'], detail=False, url_path='get-receipt')
     def get_receipt(self, request):
         user = request.user
         if request.method.__eq__('POST'):
-            uuid = json.loads(request.data.get('uuid'))
-            order = Order.objects.filter(uuid=uuid).prefetch_related('order_item_order', 'status_order').first()
-            order_data = OrderSerializer(order).data
-            print('test')
-            order_items = [items for items in order.order_item_order.all()]
-            order_items_data = OrderItemSerializer(order_items, many=True, context={'request': request}).data
-
-            status_order = [status_order for status_order in order.status_order.all()]
-            status_order_data = StatusOrderSerializer(status_order[0]).data
-
-            recepit = {'order': order_data, 'order_items': order_items_data, 'status': status_order_data}
-
-            return HttpResponse(json.dumps(recepit), status=status.HTTP_200_OK)
+            uuid = self.parse_receipt_uuid(request.data)
+            if uuid is None:
+                return Response({"errors": "uuid is missing or invalid"}, status=status.HTTP_400_BAD_REQUEST)
+            # only the caller's own orders
+            order = self.get_receipt_queryset().filter(uuid=uuid, user_id=user.id).first()
+            if order is None:
+                raise Http404
+            return Response(ReceiptSerializer(order, context={'request': request}).data, status=status.HTTP_200_OK)
         else:
-            recepit = []
-            orders = Order.objects.filter(user_id=user.id).prefetch_related('order_item_order', 'status_order')
-            order_data = OrderSerializer(orders, many=True).data
-
-            for i in range(len(order_data)):
-                order_items = [items for items in orders[i].order_item_order.all()]
-                order_items_data = OrderItemSerializer(order_items, many=True, context={'request': request}).data
+            orders = self.get_receipt_queryset().filter(user_id=user.id)
 
-                status_order = [status_order for status_order in orders[i].status_order.all()]
-                status_order_data = StatusOrderSerializer(status_order[0]).data
+            # Only paginate when the client sends ?page / ?page_size, older clients keep getting a plain list
+            paginator = ReceiptPagination()
+            if any(param in request.query_params for param in ('page', paginator.page_size_query_param)):
+                page = paginator.paginate_queryset(orders, request, view=self)
+                serializer = ReceiptSerializer(page, many=True, context={'request': request})
+                return paginator.get_paginated_response(serializer.data)
 
-                recepit.append({'order': order_data[i], 'order_items': order_items_data, 'status': status_order_data})
+            return Response(ReceiptSerializer(orders, many=True, context={'request': request}).data,
+                            status=status.HTTP_200_OK)
 
-            return HttpResponse(json.dumps(recepit), status=status.HTTP_200_OK)
+    @action(methods=['get'], detail=False, url_path='summaries')
+    def summaries(self, request):
+        # compact order history: 1 OrderSummary row per order, no item/product joins
+        queryset = OrderSummary.objects.filter(order__user_id=request.user.id).select_related('order') \
+            .order_by('order_id')
+        paginator = ReceiptPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(OrderSummarySerializer(page, many=True).data)
 
 
 class OrderItemViewSet(viewsets.ViewSet):
@@ -198,3 +390,21 @@ class OrderItemViewSet(viewsets.ViewSet):
 class StatusOrderViewSet(viewsets.ViewSet):
     queryset = StatusOrder.objects.all()
     serializer_class = StatusOrderSerializer
+
+
+class StatsViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.IsAdminUser]
+
+    @action(methods=['get'], detail=False, url_path='cache')
+    def cache(self, request):
+        return Response(cache_stats())
+
+    @action(methods=['get'], detail=False, url_path='db')
+    def db(self, request):
+        # figures of the process serving this request
+        return Response(db_stats())
+
+    @action(methods=['get'], detail=False, url_path='metrics')
+    def metrics(self, request):
+        # Prometheus text format, per process
+        return HttpResponse(prometheus_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
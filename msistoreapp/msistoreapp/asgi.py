@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'msistoreapp.settings')
+# Under ASGI, sync ORM code runs in a new thread per request, so persistent connections
+# (CONN_MAX_AGE > 0) would leave one open connection per thread: close them after each
+# request unless DB_CONN_MAX_AGE is set explicitly. Use DB_POOL=1 to reuse connections.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 import cloudinary
 import cloudinary.uploader
@@ -47,7 +48,9 @@ INSTALLED_APPS = [
     'drf_yasg',
 ]
 MIDDLEWARE = [
+    'msistore.instrumentation.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'msistore.db_routers.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,8 +70,41 @@ REST_FRAMEWORK = {
     # 'PAGE_SIZE': 2,
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
-    )
+    ),
+    # JSON with orjson (msistore/renderers.py), falls back to DRF's renderer/parser when orjson is not installed
+    'DEFAULT_RENDERER_CLASSES': (
+        'msistore.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'msistore.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # /products/export/ streams the whole catalogue
+    'DEFAULT_THROTTLE_RATES': {
+        'export': '10/hour',
+    },
+}
+# Query count / DB time / render time of every request (msistore/instrumentation.py), see /stats/metrics/
+SERVER_TIMING = True
+# Maximum queries per view URL name; over it logs a warning (raises QueryBudgetExceeded if QUERY_BUDGET_RAISE)
+QUERY_BUDGETS = {
+    'product-list': 6,
+    'product-detail': 2,
+    'category-list': 1,
+    'brand-list': 1,
+    'order-get-receipt': 8,
+    'order-summaries': 3,
+    'order-create-order': 18,
 }
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_RAISE = False
+
+# Seconds to cache the COUNT(*) of CustomPagination per filter (0 = no cache); only with a shared cache,
+# see CATALOGUE_CACHE_SHARED
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -96,9 +132,59 @@ DATABASES = {
         'NAME': 'msistoredb',
         'USER': 'root',
         'PASSWORD': '12345',
-        'HOST': ''  # mặc định localhost
+        'HOST': '',  # mặc định localhost
+        # keep connections between requests (seconds, 0 = close after every request), checked before reuse.
+        # Only for WSGI: msistoreapp/asgi.py defaults it to 0 (one thread per request under ASGI)
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# DB_POOL=1: a connection pool shared within the process (django-db-connection-pool, SQLAlchemy QueuePool).
+# Connections go back to the pool after every request, so CONN_MAX_AGE = 0; see /stats/db/
+if os.environ.get('DB_POOL') == '1':
+    DATABASES['default'].update({
+        'ENGINE': 'dj_db_conn_pool.backends.mysql',
+        'CONN_MAX_AGE': 0,
+        'POOL_OPTIONS': {
+            'POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'MAX_OVERFLOW': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+            'RECYCLE': 60 * 15,
+        },
+    })
+
+# Read replica (msistore/db_routers.py): DB_REPLICA_HOSTS=host1,host2 -> alias replica1, replica2,
+# same DB name / user as default. GET requests read from a replica; after a write the user reads from the primary for
+# REPLICA_PIN_SECONDS (pinned in the default cache, which must be shared between workers, e.g. Redis)
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES['replica%d' % index] = dict(DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append('replica%d' % index)
+DATABASE_ROUTERS = ['msistore.db_routers.ReplicaRouter']
+REPLICA_MAX_LAG = 5  # seconds, slower replicas are skipped
+REPLICA_LAG_CHECK_INTERVAL = 10  # seconds between 2 lag checks, per replica and process
+REPLICA_PIN_SECONDS = 10
+
+# Cache
+# Local-memory cache by default (dev/test); set REDIS_URL to use Redis in production
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# Seconds to cache the category/brand/products responses (0 = no cache), see msistore/caching.py
+CATALOGUE_CACHE_TIMEOUT = 60 * 15
+# Response cache and ETag / Last-Modified need a cache shared by all processes (see msistore/caching.py).
+# None = auto (off with LocMem / Dummy); True only for a single process (runserver, benchmarks)
+CATALOGUE_CACHE_SHARED = None
+
+# /products/ builds dicts from .values() instead of using ProductListSerializer (same output), see msistore/fastpath.py
+PRODUCT_LIST_FAST_PATH = False
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -140,6 +226,17 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # MEDIA_ROOT = '%s/msistore/static/' % BASE_DIR
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = '/media/'
+
+# Image uploads (msistore/uploads.py): files are staged in UPLOAD_STAGING_DIR and uploaded in the background
+# IMAGE_STORAGE_BACKEND = 'msistore.storage.LocalStorage' to test without Cloudinary
+IMAGE_STORAGE_BACKEND = 'msistore.storage.CloudinaryStorage'
+UPLOAD_STAGING_DIR = BASE_DIR / 'uploads'
+UPLOAD_ASYNC = True
+UPLOAD_WORKERS = 4
+UPLOAD_MAX_RETRIES = 3
+UPLOAD_RETRY_DELAY = 1  # seconds, doubled after every retry
 import _locale
 _locale._getdefaultlocale = (lambda *args: ['en_US', 'utf8'])
 cloudinary.config(